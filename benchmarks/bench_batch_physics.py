@@ -0,0 +1,119 @@
+# Batched physics benchmark
+#
+# Runs the same random inputs through the scalar Player and through BatchPhysics, checks that
+# every entity ends up in exactly the same state after every step and reports entity steps/sec.
+# Batching costs a fixed amount of NumPy work per step, so it only overtakes the scalar loop once
+# there are somewhere between a few hundred and a few thousand entities, depending on the machine.
+# The default count is past that point. --check only runs a small, quick comparison.
+#
+#     python benchmarks/bench_batch_physics.py [map.json] [entities] [steps]
+#     python benchmarks/bench_batch_physics.py --check [map.json]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from scripts.batch_physics import BatchPhysics
+from scripts.entities import Player
+from scripts.simulation import HeadlessGame, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, PLAYER_SIZE
+
+
+def random_inputs(rng, count, steps):
+    moves = rng.choice([0, INPUT_LEFT, INPUT_RIGHT, INPUT_RIGHT], size=(steps, count))
+    jumps = np.where(rng.random((steps, count)) < 0.05, INPUT_JUMP, 0)
+    return moves | jumps
+
+
+SIDES = ('up', 'down', 'right', 'left')
+
+# names of the parts of scalar_state and batch_state, in order
+STATE = ('pos', 'velocity', 'collisions', 'death_collisions', 'win_collision', 'is_dead', 'did_win', 'can_jump', 'air_time')
+
+
+# the state that has to match between the scalar and the batched version
+def scalar_state(players):
+    return (
+        np.array([player.pos for player in players], dtype=np.float64),
+        np.array([player.velocity for player in players], dtype=np.float64),
+        np.array([[player.collisions[side] for side in SIDES] for player in players]).reshape(len(players), len(SIDES)),
+        np.array([player.death_collisions for player in players]),
+        np.array([player.win_collision for player in players]),
+        np.array([player.is_dead for player in players]),
+        np.array([player.did_win for player in players]),
+        np.array([player.can_jump for player in players]),
+        np.array([player.air_time for player in players]),
+    )
+
+
+def batch_state(batch):
+    return (batch.pos, batch.velocity, np.stack([batch.collisions[side] for side in SIDES], axis=1), batch.death_collisions, batch.win_collision, batch.is_dead, batch.did_win, batch.can_jump, batch.air_time)
+
+
+# start positions spread over the map and random inputs for every entity and step
+def scenario(count, steps, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = [(16 + (i * 37) % 2400, 50 + (i * 13) % 150) for i in range(count)]
+    return starts, random_inputs(rng, count, steps)
+
+
+# step scalar players and BatchPhysics through the same inputs and compare their state after every step
+# returns where they first differ (None when all match), the batch and the seconds each version took
+def compare(game, starts, inputs):
+    count = len(starts)
+    players = [Player(game, start, PLAYER_SIZE) for start in starts]
+    batch = BatchPhysics(game.tilemap, count, pos=starts)
+
+    scalar_time = 0.0
+    batch_time = 0.0
+    for step in range(len(inputs)):
+        start = time.perf_counter()
+        for player, mask in zip(players, inputs[step]):
+            player.update(game.tilemap, (bool(mask & INPUT_RIGHT) - bool(mask & INPUT_LEFT), 0))
+            if mask & INPUT_JUMP:
+                player.jump()
+        scalar_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch.step(inputs[step])
+        batch_time += time.perf_counter() - start
+
+        for name, expected, actual in zip(STATE, scalar_state(players), batch_state(batch)):
+            if not np.array_equal(expected, actual):
+                differing = np.flatnonzero((expected != actual).reshape(count, -1).any(axis=1))
+                return f"step {step}, {name} of entities {differing[:10].tolist()}", batch, scalar_time, batch_time
+    return None, batch, scalar_time, batch_time
+
+
+# whether batched physics still matches the scalar code, small enough to run after every change to either
+def check(map_path='map.json', count=100, steps=300):
+    starts, inputs = scenario(int(count), int(steps))
+    mismatch, _, _, _ = compare(HeadlessGame(map_path), starts, inputs)
+    if mismatch is not None:
+        print(f"mismatch at {mismatch}")
+        return False
+    print(f"{count} entities x {steps} steps match exactly")
+    return True
+
+
+def main(map_path='map.json', count=4000, steps=600):
+    count = int(count)
+    steps = int(steps)
+    starts, inputs = scenario(count, steps)
+    mismatch, batch, scalar_time, batch_time = compare(HeadlessGame(map_path), starts, inputs)
+    if mismatch is not None:
+        print(f"mismatch at {mismatch}")
+        sys.exit(1)
+
+    print(f"{count} entities x {steps} steps match exactly ({int(batch.is_dead.sum())} dead, {int(batch.did_win.sum())} won)")
+    print(f"scalar  {count * steps / scalar_time:>12,.0f} entity steps/sec")
+    print(f"batched {count * steps / batch_time:>12,.0f} entity steps/sec")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--check']:
+        sys.exit(0 if check(*sys.argv[2:]) else 1)
+    main(*sys.argv[1:])
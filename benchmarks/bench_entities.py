@@ -0,0 +1,75 @@
+# Entity manager benchmark
+#
+# Spawns entities over the map, steps them through the EntityManager and checks that the grid
+# broadphase finds exactly the overlapping pairs a check of every pair finds. Also churns spawns and
+# despawns to show the pools hand back the same objects instead of allocating new ones.
+#
+#     python benchmarks/bench_entities.py [map.json] [entities] [steps]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scripts.entity_manager import EntityManager
+from scripts.simulation import HeadlessGame, PLAYER_SIZE
+
+
+def all_pairs(entities):
+    rects = [entity.rect() for entity in entities]
+    pairs = []
+    for i in range(len(rects)):
+        for j in range(i + 1, len(rects)):
+            if rects[i].colliderect(rects[j]):
+                pairs.append((entities[i], entities[j]))
+    return pairs
+
+
+def main(map_path='map.json', count=500, steps=300):
+    count = int(count)
+    steps = int(steps)
+    game = HeadlessGame(map_path)
+    manager = EntityManager(game)
+    for i in range(count):
+        manager.spawn('player', (16 + (i * 37) % 2400, 50 + (i * 13) % 150), PLAYER_SIZE)
+
+    update_time = 0.0
+    grid_time = 0.0
+    naive_time = 0.0
+    for step in range(steps):
+        start = time.perf_counter()
+        manager.update(game.tilemap)
+        update_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        pairs = manager.overlapping_pairs()
+        grid_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = all_pairs(manager.entities)
+        naive_time += time.perf_counter() - start
+
+        if pairs != expected:
+            print(f"pair mismatch at step {step}")
+            sys.exit(1)
+
+    print(f"{count} entities x {steps} steps, overlapping pairs match ({len(pairs)} at the end)")
+    print(f"update       {count * steps / update_time:>12,.0f} entity steps/sec")
+    print(f"grid pairs   {grid_time / steps * 1000:>12.3f} ms/step")
+    print(f"every pair   {naive_time / steps * 1000:>12.3f} ms/step")
+
+    # despawn and respawn half of the entities over and over, the pools should cover every spawn
+    created = {id(entity) for entity in manager.entities}
+    for _ in range(100):
+        for entity in manager.entities[::2]:
+            manager.despawn(entity)
+        manager.update(game.tilemap)
+        for i in range(count - len(manager.entities)):
+            manager.spawn('player', (16 + (i * 53) % 2400, 50), PLAYER_SIZE)
+    new = sum(1 for entity in manager.entities if id(entity) not in created)
+    print(f"100 rounds of despawning half the entities allocated {new} new ones")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,49 @@
+# Presentation benchmark
+#
+# Compares scaling the display the old way, into a brand new window sized surface every frame,
+# with Presenter.present scaling into the window surface it already has. display.update is left
+# out so only the scaling path is measured.
+#
+#     python benchmarks/bench_present.py [frames]
+
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pygame
+
+from scripts.presentation import Presenter
+
+
+def main(frames=2000):
+    frames = int(frames)
+    pygame.init()
+    presenter = Presenter((350, 240), window_size=(640, 480))
+    presenter.display.fill((40, 90, 160))
+    size = presenter.screen.get_size()
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        presenter.screen.blit(pygame.transform.scale(presenter.display, size), (0, 0))
+    old = (time.perf_counter() - start) / frames
+    old_pixels = pygame.image.tobytes(presenter.screen, 'RGB')
+
+    # identical output, minus the temporary surface
+    presenter.screen.fill(0)
+    start = time.perf_counter()
+    for _ in range(frames):
+        pygame.transform.scale(presenter.display, presenter.target_rect.size, presenter.target)
+    new = (time.perf_counter() - start) / frames
+    if pygame.image.tobytes(presenter.screen, 'RGB') != old_pixels:
+        print('scaled output differs')
+        sys.exit(1)
+
+    print(f"scale + blit new surface  {old * 1e6:8.1f} us/frame, 1 surface of {size[0]}x{size[1]} allocated per frame")
+    print(f"scale into window         {new * 1e6:8.1f} us/frame, no allocation")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
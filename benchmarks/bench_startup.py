@@ -0,0 +1,48 @@
+# Startup benchmark
+#
+# Times Game() from scratch with every PNG decoded and again with the on-disk asset cache warm.
+#
+#     python benchmarks/bench_startup.py [runs]
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.getcwd())
+
+import main
+from scripts import utilities
+
+
+def time_startup(runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        main.Game()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(runs=5):
+    runs = int(runs)
+    cache_dir = tempfile.mkdtemp()
+
+    utilities.asset_cache = None
+    decoded = time_startup(runs)
+
+    # the first start fills the cache, the timed ones read from it
+    utilities.asset_cache = utilities.AssetCache(cache_dir)
+    main.Game()
+    utilities.asset_cache = utilities.AssetCache(cache_dir)
+    cached = time_startup(runs)
+
+    print(f"decode PNGs  {decoded * 1000:8.2f} ms")
+    print(f"asset cache  {cached * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:])
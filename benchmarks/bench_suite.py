@@ -0,0 +1,313 @@
+# Benchmark suite
+#
+# Generates synthetic maps from 1K to 1M tiles with mapgen.py and times each tilemap and physics
+# subsystem on every size, headless under the SDL dummy driver. Each operation reports its best
+# time and its peak memory. Results are written as JSON, and a previous results file can be passed
+# to see how much each operation got faster or slower.
+#
+#     python benchmarks/bench_suite.py [--sizes 1000 10000 100000 1000000] [--output bench_results.json] [--compare old.json]
+#
+# Peak memory is measured in a separate run of each operation, as how far the process's resident
+# memory peaked above where it was before the run, so it includes the pixels pygame keeps for
+# surfaces. That needs Linux, which can reset the peak through /proc/self/clear_refs, and memory
+# freed by earlier runs is handed back with glibc's malloc_trim first so reusing it does not hide new
+# allocations. Elsewhere it falls back to tracemalloc, which only sees Python objects, and the
+# results file says which was used.
+
+import argparse
+import ctypes
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import pygame
+
+from mapgen import write_map
+from scripts.entities import PhysicsEntity
+from scripts.tilemaps import Tilemap, CHUNK_SIZE
+from scripts.simulation import PLAYER_SIZE
+from scripts.utilities import load_images, Animation
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+VIEW_SIZE = (350, 240)
+
+PHYSICS_QUERIES = 100000
+WARM_FRAMES = 1000
+WARM_AREA = (8, 4)
+ENTITIES = 200
+ENTITY_STEPS = 200
+
+
+# the assets a Tilemap draws with and a PhysicsEntity animates with, without the rest of the game
+class BenchGame:
+    def __init__(self):
+        pygame.display.init()
+        if not pygame.display.get_surface():
+            pygame.display.set_mode((1, 1))
+        self.assets = {tile_type: load_images('tiles/' + tile_type) for tile_type in ('stone', 'grass', 'decor', 'large_decor', 'platforms', 'bridge', 'lava', 'trophy')}
+        self.assets['player/idle'] = Animation(load_images('entities/player/idle'), img_dur=6)
+        self.game_over = False
+        self.game_winner = False
+
+
+# one generated map, loaded once and shared by the operations that do not load it themselves
+class BenchMap:
+    def __init__(self, game, directory, size):
+        self.game = game
+        self.size = size
+        self.path = os.path.join(directory, str(size) + '.json')
+        self.save_path = os.path.join(directory, str(size) + '.saved.json')
+        self.tiles = write_map(self.path, size)
+
+        self.tilemap = Tilemap(game, tile_size=16)
+        self.tilemap.load(self.path)
+        locs = self.tilemap.tilemap.keys()
+        tile_size = self.tilemap.tile_size
+        self.bounds = pygame.Rect(min(loc[0] for loc in locs) * tile_size, min(loc[1] for loc in locs) * tile_size, 0, 0)
+        self.bounds.width = (max(loc[0] for loc in locs) + 1) * tile_size - self.bounds.x
+        self.bounds.height = (max(loc[1] for loc in locs) + 1) * tile_size - self.bounds.y
+
+    def random_positions(self, count, seed=0):
+        rng = random.Random(seed)
+        return [(rng.uniform(self.bounds.left, self.bounds.right), rng.uniform(self.bounds.top, self.bounds.bottom)) for _ in range(count)]
+
+
+# operations get the map, set up whatever they need untimed and return (run, items) where run is the timed part
+def save_json(bench):
+    return (lambda: bench.tilemap.save(bench.save_path)), bench.tiles
+
+
+def load_json(bench):
+    tilemap = Tilemap(bench.game, tile_size=16)
+    return (lambda: tilemap.load(bench.path)), bench.tiles
+
+
+def autotile(bench):
+    return bench.tilemap.autotile, bench.tiles
+
+
+def build_physics(bench):
+    return bench.tilemap.build_physics, bench.tiles
+
+
+def physics_queries(bench):
+    tilemap = bench.tilemap
+    positions = bench.random_positions(PHYSICS_QUERIES)
+    tilemap.physics_queries = {}
+
+    def run():
+        tilemap.physics_queries = {}
+        for pos in positions:
+            tilemap.physics_rects_around(pos)
+    return run, PHYSICS_QUERIES
+
+
+# every chunk of the map built once by sweeping the view over all of it
+def render_cold(bench):
+    tilemap = bench.tilemap
+    surf = pygame.Surface(VIEW_SIZE)
+    offsets = [(x, y) for x in range(bench.bounds.left, bench.bounds.right, VIEW_SIZE[0]) for y in range(bench.bounds.top, bench.bounds.bottom, VIEW_SIZE[1])]
+
+    # the chunks of an earlier run are freed before the memory baseline is taken
+    tilemap.chunks = {}
+
+    def run():
+        tilemap.chunks = {}
+        for offset in offsets:
+            tilemap.render(surf, offset=offset)
+    return run, len(offsets)
+
+
+# frames drawn from chunks that are already built, all within an area small enough for the chunk cache to keep
+def render_warm(bench):
+    tilemap = bench.tilemap
+    surf = pygame.Surface(VIEW_SIZE)
+    area = (WARM_AREA[0] * CHUNK_SIZE * tilemap.tile_size, WARM_AREA[1] * CHUNK_SIZE * tilemap.tile_size)
+    offsets = [(bench.bounds.left + int(x - bench.bounds.left) % area[0], bench.bounds.top + int(y - bench.bounds.top) % area[1]) for x, y in bench.random_positions(WARM_FRAMES)]
+    for offset in offsets:
+        tilemap.render(surf, offset=offset)
+
+    def run():
+        for offset in offsets:
+            tilemap.render(surf, offset=offset)
+    return run, WARM_FRAMES
+
+
+def entity_update(bench):
+    tilemap = bench.tilemap
+    entities = [PhysicsEntity(bench.game, 'player', (x, bench.bounds.top - 32), PLAYER_SIZE) for x, _ in bench.random_positions(ENTITIES)]
+
+    def run():
+        for step in range(ENTITY_STEPS):
+            movement = (1 if (step // 50) % 2 else -1, 0)
+            for entity in entities:
+                entity.update(tilemap, movement)
+    return run, ENTITIES * ENTITY_STEPS
+
+
+OPERATIONS = [
+    ('save_json', save_json),
+    ('load_json', load_json),
+    ('autotile', autotile),
+    ('build_physics', build_physics),
+    ('physics_queries', physics_queries),
+    ('render_cold', render_cold),
+    ('render_warm', render_warm),
+    ('entity_update', entity_update),
+]
+
+
+# give memory freed by earlier runs back to the kernel, only glibc can
+def release_free_memory():
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# start a new peak at the current resident memory, False where the kernel does not support it
+def reset_peak_rss():
+    try:
+        f = open('/proc/self/clear_refs', 'w')
+        f.write('5')
+        f.close()
+        return True
+    except OSError:
+        return False
+
+
+# a memory line of /proc/self/status in bytes, VmRSS for now and VmHWM for the peak
+def process_memory(field):
+    f = open('/proc/self/status', 'r')
+    lines = f.readlines()
+    f.close()
+    for line in lines:
+        if line.startswith(field + ':'):
+            return int(line.split()[1]) * 1024
+    raise OSError(field + ' is not in /proc/self/status')
+
+
+def peak_memory_source():
+    return 'rss' if reset_peak_rss() else 'tracemalloc'
+
+
+def measure(bench, prepare, repeat):
+    best = None
+    for _ in range(repeat):
+        run, items = prepare(bench)
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    run, items = prepare(bench)
+    gc.collect()
+    release_free_memory()
+    if reset_peak_rss():
+        before = process_memory('VmRSS')
+        run()
+        peak = max(0, process_memory('VmHWM') - before)
+    else:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, items, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def size_label(size):
+    for unit, scale in (('M', 1000000), ('K', 1000)):
+        if size >= scale and size % scale == 0:
+            return str(size // scale) + unit
+    return str(size)
+
+
+def run_suite(sizes, operations, repeat):
+    game = BenchGame()
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            bench = BenchMap(game, directory, size)
+            print(f"{size_label(size)} ({bench.tiles:,} tiles, {bench.bounds.width // bench.tilemap.tile_size}x{bench.bounds.height // bench.tilemap.tile_size})")
+            for name, prepare in operations:
+                seconds, items, peak = measure(bench, prepare, repeat)
+                results.append({'size': size, 'tiles': bench.tiles, 'operation': name, 'seconds': seconds, 'items': items, 'us_per_item': seconds / items * 1000000, 'peak_bytes': peak})
+                print(f"    {name:<16} {seconds * 1000:>10.1f} ms {seconds / items * 1000000:>10.2f} us/item {peak / 1048576:>9.1f} MB peak")
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+# new time / old time for every operation and size found in both runs
+def compare(results, old_results):
+    old = {(result['size'], result['operation']): result for result in old_results}
+    matches = [(result, old[(result['size'], result['operation'])]) for result in results if (result['size'], result['operation']) in old]
+    if not matches:
+        print('the previous run has none of these sizes and operations')
+        return
+    print('compared to the previous run (new / old time):')
+    for result, previous in matches:
+        if previous['seconds'] > 0:
+            print(f"    {size_label(result['size']):>5} {result['operation']:<16} {result['seconds'] / previous['seconds']:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every tilemap and physics subsystem on generated maps of growing size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='tile counts of the generated maps')
+    parser.add_argument('--operations', nargs='+', choices=[name for name, _ in OPERATIONS], default=None, help='only run these operations')
+    parser.add_argument('--repeat', type=int, default=1, help='time every operation this many times and keep the best')
+    parser.add_argument('--output', default='bench_results.json', help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='a results file from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    # the assets are loaded relative to the repo root, the result files relative to where this was started
+    output = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(ROOT)
+
+    operations = [(name, prepare) for name, prepare in OPERATIONS if not args.operations or name in args.operations]
+    results = run_suite(args.sizes, operations, max(1, args.repeat))
+
+    f = open(output, 'w')
+    json.dump({
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'peak_memory': peak_memory_source(),
+        'results': results,
+    }, f, indent=2)
+    f.close()
+    print('wrote ' + output)
+
+    if compare_path:
+        f = open(compare_path, 'r')
+        old_results = json.load(f)['results']
+        f.close()
+        compare(results, old_results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
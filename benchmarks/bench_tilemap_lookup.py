@@ -0,0 +1,56 @@
+# Tilemap lookup benchmark
+#
+# Compares the old "x;y" string keyed tilemap against the (x, y) keyed Tilemap
+# for the neighbourhood lookups done every frame. Run from the repo root:
+#
+#     python benchmarks/bench_tilemap_lookup.py
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scripts.tilemaps import Tilemap, NEIGHBOR_OFFSETS
+
+LOOKUPS = 200000
+
+
+# the lookup Tilemap.tiles_around used to do with string keys
+def string_tiles_around(tilemap, tile_size, pos):
+    tiles = []
+    tile_loc = (int(pos[0] // tile_size), int(pos[1] // tile_size))
+    for offset in NEIGHBOR_OFFSETS:
+        check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+        if check_loc in tilemap:
+            tiles.append(tilemap[check_loc])
+    return tiles
+
+
+def run(label, lookup, positions):
+    start = time.perf_counter()
+    for pos in positions:
+        lookup(pos)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(positions) * len(NEIGHBOR_OFFSETS) / elapsed:>14,.0f} lookups/sec")
+
+
+def main(path='map.json'):
+    f = open(path, 'r')
+    string_map = json.load(f)['tilemap']
+    f.close()
+
+    tilemap = Tilemap(None)
+    tilemap.load(path)
+
+    # walk the player position across the whole level
+    width = (max(tile.pos[0] for tile in tilemap.tilemap.values()) + 2) * tilemap.tile_size
+    positions = [((i * 7) % width, 100 + (i * 3) % 300) for i in range(LOOKUPS)]
+
+    run('string keys', lambda pos: string_tiles_around(string_map, tilemap.tile_size, pos), positions)
+    run('tuple keys', tilemap.tiles_around, positions)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
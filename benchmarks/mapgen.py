@@ -0,0 +1,72 @@
+# Synthetic map generator
+#
+# Builds levels of any size in the map.json format for the benchmarks. Each level is rolling stone
+# ground with grass on top, lava pits, floating platforms, decor, and a trophy at the far end. The
+# ground gets deeper as maps get bigger, so large maps grow both wider and taller. The same size and
+# seed always give the same map.
+#
+#     python benchmarks/mapgen.py 100000 big.json [seed]
+
+import json
+import math
+import random
+import sys
+
+
+def generate_map(tile_count, seed=0, tile_size=16):
+    rng = random.Random(seed)
+    depth = max(6, int(math.sqrt(tile_count / 16)))
+    tilemap = {}
+    offgrid = []
+
+    def put(x, y, tile_type, variant=0):
+        tilemap[str(x) + ';' + str(y)] = {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+
+    ground = 12
+    x = 0
+    while len(tilemap) < tile_count - 1:
+        # the surface wanders up and down a tile at a time, with flat ground around the start
+        if x > 8 and rng.random() < 0.2:
+            ground = min(16, max(8, ground + rng.choice([-1, 1])))
+
+        # lava sits a tile down in a one tile pit, so the level can still be jumped through
+        if x > 8 and rng.random() < 0.04:
+            put(x, ground + 1, 'lava', rng.randint(0, 1))
+            top = ground + 2
+        else:
+            put(x, ground, 'grass' if rng.random() < 0.3 else 'stone', 0)
+            top = ground + 1
+        for y in range(top, ground + depth):
+            put(x, y, 'stone', 0)
+
+        # platforms floating over the ground, decor standing on it
+        if x % 12 == 6:
+            for px in range(x, x + 3):
+                put(px, ground - 4, 'platforms', 0)
+        elif rng.random() < 0.05:
+            put(x, ground - 1, 'decor', rng.randint(0, 2))
+        elif rng.random() < 0.02:
+            put(x, ground - 2, 'large_decor', rng.randint(0, 2))
+        if rng.random() < 0.01:
+            offgrid.append({'type': 'decor', 'variant': rng.randint(0, 2), 'pos': [x * tile_size + rng.randint(0, tile_size - 1), (ground - 1) * tile_size + 4]})
+        x += 1
+
+    put(x, ground - 1, 'trophy', 0)
+    put(x, ground, 'stone', 0)
+    return {'tilemap': tilemap, 'tile_size': tile_size, 'offgrid': offgrid}
+
+
+def write_map(path, tile_count, seed=0):
+    map_data = generate_map(tile_count, seed)
+    f = open(path, 'w')
+    json.dump(map_data, f)
+    f.close()
+    return len(map_data['tilemap'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        print('usage: python benchmarks/mapgen.py TILES OUTPUT [SEED]')
+        sys.exit(1)
+    count = write_map(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) == 4 else 0)
+    print(f"wrote {count:,} tiles to {sys.argv[2]}")
@@ -3,22 +3,30 @@
 import sys
 import pygame
 
-from scripts.utilities import load_images
-from scripts.tilemaps import Tilemap
+from scripts.utilities import load_images, save_asset_cache, TextureAtlas
+from scripts.tilemaps import Tilemap, AUTOTILE_TYPES
+from scripts.presentation import Presenter
+from scripts.journal import EditJournal
+from scripts.navigation import NavigationBuilder
 
 RENDER_SCALE = 2.0
 
+# editing tools, picked with the number keys 1 to 4
+TOOLS = ['paint', 'rect', 'fill', 'select']
+
 class Editor:
     def __init__(self):
         pygame.init()
 
         pygame.display.set_caption('editor')
-        self.screen = pygame.display.set_mode((640, 480))
-        self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter((320, 240), scale=RENDER_SCALE)
+        self.screen = self.presenter.screen
+        self.display = self.presenter.display
 
         self.clock = pygame.time.Clock()
         
-        self.assets = {
+        self.atlas = TextureAtlas()
+        self.assets = self.atlas.pack({
             'stone': load_images('tiles/stone'),
             'grass': load_images('tiles/grass'),
             'decor': load_images('tiles/decor'),
@@ -27,7 +35,8 @@ class Editor:
             'bridge': load_images('tiles/bridge'),
             'lava': load_images('tiles/lava'),
             'trophy': load_images('tiles/trophy')
-        }
+        })
+        save_asset_cache()
         
         self.movement = [False, False, False, False]
         
@@ -37,6 +46,10 @@ class Editor:
             self.tilemap.load('map.json')
         except FileNotFoundError:
             pass
+
+        # undo history and autosave, edits from a session that was not saved are picked up again
+        self.journal = EditJournal(self.tilemap, 'map.json')
+        self.journal.recover()
         
         self.scroll = [0, 0]
         
@@ -48,7 +61,88 @@ class Editor:
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
+        self.autotiling = False
+
+        self.tool = 'paint'
+        self.drag_start = None
+        self.selection = None
+        self.clipboard = None
+
+        # N tints every cell the player can stand on by whether it can be reached from the start
+        self.show_navigation = False
+        self.navigation = None
+        self.navigation_builder = NavigationBuilder('map.json')
+        self.reachable_tint = pygame.Surface((self.tilemap.tile_size, self.tilemap.tile_size), pygame.SRCALPHA)
+        self.reachable_tint.fill((0, 255, 0, 50))
+        self.unreachable_tint = pygame.Surface((self.tilemap.tile_size, self.tilemap.tile_size), pygame.SRCALPHA)
+        self.unreachable_tint.fill((255, 0, 0, 110))
         
+    # place the current tile and, with autotiling on, fix up the variants of it and its neighbours
+    def place_tile(self, tile_pos):
+        tile_type = self.tile_list[self.tile_group]
+        if self.autotiling and tile_type in AUTOTILE_TYPES:
+            # autotile picks the variant, so painting over the same type again changes nothing
+            tile = self.tilemap.tilemap.get(tile_pos)
+            if tile and tile.type == tile_type:
+                return
+        self.tilemap.set_tile(tile_pos, tile_type, self.tile_variant)
+        if self.autotiling:
+            self.tilemap.autotile_around(tile_pos)
+
+    # apply a batch of (tile_pos, type, variant) changes, with autotiling fixing up everything around them afterwards
+    def apply_changes(self, changes):
+        self.tilemap.set_tiles(changes)
+        if self.autotiling:
+            self.tilemap.autotile_cells([change[0] for change in changes])
+
+    # the (left, top, right, bottom) tile bounds of the rectangle between two corners
+    def tile_rect(self, corner_a, corner_b):
+        return (min(corner_a[0], corner_b[0]), min(corner_a[1], corner_b[1]), max(corner_a[0], corner_b[0]), max(corner_a[1], corner_b[1]))
+
+    # fill every cell of a rectangle with the tile, a tile type of None clears it instead
+    def fill_rect(self, corner_a, corner_b, tile_type, variant):
+        left, top, right, bottom = self.tile_rect(corner_a, corner_b)
+        self.apply_changes([((x, y), tile_type, variant) for x in range(left, right + 1) for y in range(top, bottom + 1)])
+
+    # replace the connected area of the same tile type under the cursor, a tile type of None clears it instead
+    def flood_fill(self, tile_pos, tile_type, variant):
+        self.apply_changes([(loc, tile_type, variant) for loc in self.tilemap.flood_region(tile_pos)])
+
+    # remember the grid tiles and the offgrid decor anchored inside a rectangle, relative to its top left corner
+    def copy_region(self, corner_a, corner_b):
+        left, top, right, bottom = self.tile_rect(corner_a, corner_b)
+        tiles = []
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                tile = self.tilemap.tilemap.get((x, y))
+                if tile:
+                    tiles.append(((x - left, y - top), tile.type, tile.variant))
+
+        size = self.tilemap.tile_size
+        area = pygame.Rect(left * size, top * size, (right - left + 1) * size, (bottom - top + 1) * size)
+        offgrid = [((tile.pos[0] - area.x, tile.pos[1] - area.y), tile.type, tile.variant) for tile in self.tilemap.offgrid_in_rect(area) if area.collidepoint(tile.pos)]
+        self.clipboard = (tiles, offgrid)
+
+    # place the copied region with its top left corner on a tile position
+    def paste_region(self, tile_pos):
+        if not self.clipboard:
+            return
+        tiles, offgrid = self.clipboard
+        self.apply_changes([((tile_pos[0] + offset[0], tile_pos[1] + offset[1]), tile_type, variant) for offset, tile_type, variant in tiles])
+        size = self.tilemap.tile_size
+        self.tilemap.add_offgrid_tiles([((tile_pos[0] * size + offset[0], tile_pos[1] * size + offset[1]), tile_type, variant) for offset, tile_type, variant in offgrid])
+        self.journal.checkpoint()
+
+    # the navigation overlay, plus a square next to the current tile that is green while the trophy can be reached
+    def render_navigation(self, render_scroll):
+        size = self.tilemap.tile_size
+        view = self.display.get_rect(topleft=render_scroll)
+        reachable = self.navigation.reachable()
+        for node in self.navigation.nodes:
+            if view.collidepoint(node[0] * size, node[1] * size) or view.collidepoint(node[0] * size + size - 1, node[1] * size + size - 1):
+                self.display.blit(self.reachable_tint if node in reachable else self.unreachable_tint, (node[0] * size - render_scroll[0], node[1] * size - render_scroll[1]))
+        pygame.draw.rect(self.display, (0, 200, 0) if self.navigation.completable() else (200, 0, 0), (24, 5, 6, 6))
+
     def run(self):
         while True:
             self.display.fill((0, 0, 0))
@@ -59,6 +153,13 @@ class Editor:
             render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
             
             self.tilemap.render(self.display, offset=render_scroll)
+
+            # after a stroke that changed physics tiles the index is rebuilt in the background, the old one stays up until then
+            if self.show_navigation:
+                if not (self.clicking or self.right_clicking):
+                    self.navigation = self.navigation_builder.update(self.tilemap)
+                if self.navigation:
+                    self.render_navigation(render_scroll)
             
             
             # show the current tile on the top left of the screen
@@ -67,8 +168,7 @@ class Editor:
             
             
             # keeps tack of the current mouse position and tile position
-            mpos = pygame.mouse.get_pos()
-            mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
+            mpos = self.presenter.to_display(pygame.mouse.get_pos())
             tile_pos = (int((mpos[0] + self.scroll[0]) // self.tilemap.tile_size), int((mpos[1] + self.scroll[1]) // self.tilemap.tile_size))
             
             # display the ongrid and off grid tiles
@@ -77,22 +177,30 @@ class Editor:
             else:
                 self.display.blit(current_tile_img, mpos)
             
-            if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
-            if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+            # outline the rectangle being dragged out and the current selection
+            size = self.tilemap.tile_size
+            outlines = []
+            if self.drag_start and self.tool in ('rect', 'select'):
+                outlines.append(self.tile_rect(self.drag_start, tile_pos))
+            if self.selection and self.tool == 'select':
+                outlines.append(self.selection)
+            for left, top, right, bottom in outlines:
+                pygame.draw.rect(self.display, (255, 255, 255), (left * size - render_scroll[0], top * size - render_scroll[1], (right - left + 1) * size, (bottom - top + 1) * size), 1)
+
+            if self.clicking and self.ongrid and self.tool == 'paint':
+                self.place_tile(tile_pos)
+            if self.right_clicking and self.tool == 'paint':
+                self.tilemap.remove_tile(tile_pos)
+                if self.autotiling:
+                    self.tilemap.autotile_around(tile_pos)
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile)
             
             self.display.blit(current_tile_img, (5, 5))
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.journal.flush()
                     pygame.quit()
                     sys.exit()
                  
@@ -100,10 +208,14 @@ class Editor:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:
                         self.clicking = True
-                        if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
+                        if not self.ongrid and self.tool == 'paint':
+                            self.tilemap.add_offgrid(self.tile_list[self.tile_group], self.tile_variant, (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1]))
                     if event.button == 3:
                         self.right_clicking = True
+                    if event.button in (1, 3):
+                        self.drag_start = tile_pos
+                        if self.tool == 'fill':
+                            self.flood_fill(tile_pos, self.tile_list[self.tile_group] if event.button == 1 else None, self.tile_variant)
                     if self.shift:
                         if event.button == 4:
                             self.tile_variant = (self.tile_variant - 1) % len(self.assets[self.tile_list[self.tile_group]])
@@ -120,14 +232,18 @@ class Editor:
                 if event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:
                         self.clicking = False
-                        if self.ongrid:
-                            self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {
-                                'type': self.tile_list[self.tile_group],
-                                'variant': self.tile_variant,
-                                 'pos': tile_pos
-                        }
+                        if self.ongrid and self.tool == 'paint':
+                            self.place_tile(tile_pos)
                     if event.button == 3:
                         self.right_clicking = False
+                    if event.button in (1, 3) and self.drag_start:
+                        if self.tool == 'rect':
+                            self.fill_rect(self.drag_start, tile_pos, self.tile_list[self.tile_group] if event.button == 1 else None, self.tile_variant)
+                        if self.tool == 'select':
+                            self.selection = self.tile_rect(self.drag_start, tile_pos)
+                        self.drag_start = None
+                    # a whole stroke is undone at once
+                    self.journal.checkpoint()
                     
                 # camera movement controls in the editor 
                 if event.type == pygame.KEYDOWN:
@@ -142,9 +258,26 @@ class Editor:
                     if event.key == pygame.K_g:
                         self.ongrid = not self.ongrid   
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        # continuous autotiling, the whole map is fixed up once when it is switched on
+                        self.autotiling = not self.autotiling
+                        if self.autotiling:
+                            self.tilemap.autotile()
+                            self.journal.checkpoint()
+                    if event.key in (pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4):
+                        self.tool = TOOLS[event.key - pygame.K_1]
+                        self.drag_start = None
+                    if event.key == pygame.K_c and self.selection:
+                        self.copy_region(self.selection[:2], self.selection[2:])
+                    if event.key == pygame.K_v:
+                        self.paste_region(tile_pos)
+                    if event.key == pygame.K_z:
+                        self.journal.undo()
+                    if event.key == pygame.K_y:
+                        self.journal.redo()
                     if event.key == pygame.K_o:
-                        self.tilemap.save('map.json') 
+                        self.journal.save()
+                    if event.key == pygame.K_n:
+                        self.show_navigation = not self.show_navigation
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
                     
@@ -162,8 +295,9 @@ class Editor:
                         self.shift = False
             
             
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
+            self.journal.autosave()
+
+            self.presenter.present()
             self.clock.tick(60)
 
 Editor().run()
\ No newline at end of file
@@ -1,24 +1,57 @@
 # Main Game File 
 
+import argparse
 import pygame
 import sys
-from scripts.utilities import load_image, load_images, Animation
-from scripts.entities import Player, PhysicsEntity
+from scripts.utilities import load_image, load_images, save_asset_cache, Animation, TextureAtlas
+from scripts.entities import Player, PhysicsEntity, COLLISION_NEARBY, COLLISION_SWEPT
 from scripts.tilemaps import Tilemap
+from scripts.entity_manager import EntityManager
+from scripts.streaming import StreamingTilemap
+from scripts.mapformat import is_binary_map
+from scripts.profiler import FrameProfiler
+from scripts.presentation import Presenter, SCALE_MODES
+from scripts.simulation import STEPS_PER_SECOND, INPUT_RESET, INPUT_JUMP, INPUT_LEFT, INPUT_RIGHT, PLAYER_START, PLAYER_SIZE, input_mask
+from scripts.replay import ReplayRecorder, ReplayPlayer, load_replay
+from scripts.campaign import Campaign, load_level_pack
+
+# the most physics steps one rendered frame catches up on, a slower machine slows the game down instead of falling further behind
+MAX_STEPS_PER_FRAME = 10
+
+# everything that changes while a level is played, captured without copying the map
+class GameSnapshot:
+    __slots__ = ('player', 'tilemap', 'scroll', 'game_over', 'game_winner')
+
+    def __init__(self, game):
+        self.player = game.player.snapshot()
+        self.tilemap = game.tilemap.snapshot()
+        self.scroll = tuple(game.scroll)
+        self.game_over = game.game_over
+        self.game_winner = game.game_winner
+
 
 class Game:
-    def __init__(self):
+    def __init__(self, map_path='map.json', stream_radius=None, profile_trace=None, window_size=(640, 480), scale_mode='stretch', record_path=None, replay_inputs=None, collision_mode=COLLISION_NEARBY, frame_cap=STEPS_PER_SECOND, campaign_path=None):
         pygame.init()
 
         pygame.display.set_caption('Ninja Obstacle Course')
-        self.screen = pygame.display.set_mode((640, 480))
-        self.display = pygame.Surface((350, 240))
+        self.presenter = Presenter((350, 240), window_size=window_size, scale_mode=scale_mode)
+        self.screen = self.presenter.screen
+        self.display = self.presenter.display
 
         self.clock = pygame.time.Clock()
 
+        # frames are drawn at up to frame_cap per second, or as fast as possible with 0, while physics always
+        # runs at STEPS_PER_SECOND, accumulator is how many steps the time since the last step is worth
+        self.frame_cap = frame_cap
+        self.accumulator = 0
+
         self.movement = [False, False]
+        self.jump_pressed = False
 
-        self.assets = {
+        # tiles and animation frames all live in one atlas surface
+        self.atlas = TextureAtlas()
+        self.assets = self.atlas.pack({
             # game screens
             'background': load_image('background.png'),
             'game_over': load_image('game_over.png'),
@@ -41,151 +74,302 @@ class Game:
             'player/jump': Animation(load_images("entities/player/jump")),
             'player/winner': Animation(load_images("entities/player/winner")),
             'player/death': Animation(load_images("entities/player/death")),
-        }
+        })
+        save_asset_cache()
+
+        self.player = Player(self, PLAYER_START, PLAYER_SIZE, collision_mode=collision_mode)
 
-        print(self.assets)
+        # a campaign plays the maps of a level pack one after another, starting with the first
+        self.campaign = None
+        if campaign_path:
+            self.campaign = Campaign(self, load_level_pack(campaign_path))
+            map_path = self.campaign.levels[0]
 
-        self.player = Player(self, (50, 50), (8, 15))
+        self.stream_radius = stream_radius
+        self.tilemap = self.load_tilemap(map_path)
 
-        self.tilemap = Tilemap(self, tile_size=16)
-        self.tilemap.load('map.json')
+        # every entity besides the player, pooled and kept in a grid for overlap queries
+        self.entities = EntityManager(self)
 
         self.scroll = [0, 0]
         self.game_over = False
         self.game_winner = False
 
-    def reset_game(self):
-        self.player = Player(self, (50, 50), (8, 15))
-        self.tilemap.load('map.json') 
-        self.scroll = [0, 0]        
-        self.game_over = False    # bool to see if the player died
-        self.game_winner = False  # bool to see if the player won
-
-    # show a game over screen after the game has ended
-    def show_game_over_screen(self):
-        print("Entered show_game_over_screen.")  # Debugging message
-        while True:
-            # Draw the game over screen
-            self.display.blit(self.assets['background'], (0, 0))
-            self.display.blit(self.assets['game_over'], (35, 0))
-        
-            pygame.font.init()
-            font = pygame.font.SysFont(None, 25)
-            text = font.render('Press Y to Play Again or N to Quit', True, (255, 255, 255))
-            self.display.blit(text, (50, 210))
-
-            # Handle events for play again or quit
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_y:
-                        print("Resetting game...")  # Debugging
-                        self.reset_game()  # Reset game state and return to main loop
-                        return
-                    if event.key == pygame.K_n:
-                        pygame.quit()
-                        sys.exit()
+        # end screens are only drawn once
+        self.end_screens = {}
+        self.end_screen_text = None
+
+        # frame timings, F3 shows them on screen
+        self.profiler = FrameProfiler(trace_path=profile_trace)
+
+        # the input of every frame can be recorded, or played back from an earlier recording
+        self.recorder = ReplayRecorder(record_path, map_path) if record_path else None
+        self.replay = ReplayPlayer(self, replay_inputs) if replay_inputs is not None else None
+        self.level_restarted = False
+
+        # player position and scroll before the last step, frames are drawn between them and the current ones
+        self.previous_pos = tuple(self.player.pos)
+        self.previous_scroll = tuple(self.scroll)
+
+        # the level as it starts, restarting it is a restore instead of building a new player and map
+        self.start_state = self.snapshot_state()
+
+        if self.campaign:
+            self.campaign.prefetch()
+            self.set_level_caption()
+
+    # binary maps can be streamed around the camera instead of being loaded whole, every other map is loaded whole
+    # assets is what the tilemap draws with, the game itself unless the map is loaded off the main thread
+    def load_tilemap(self, map_path, assets=None):
+        assets = assets or self
+        if self.stream_radius is not None and is_binary_map(map_path):
+            return StreamingTilemap(assets, map_path, radius=self.stream_radius)
+        tilemap = Tilemap(assets, tile_size=16)
+        tilemap.load(map_path)
+        return tilemap
+
+    def set_level_caption(self):
+        pygame.display.set_caption('Ninja Obstacle Course - level ' + str(self.campaign.level + 1) + ' of ' + str(len(self.campaign.levels)))
+
+    # swap in the next map of the campaign, loaded in the background while this one was played, and start it like a restart does
+    # after the last level that is the first one again
+    def next_level(self):
+        previous = self.tilemap
+        self.tilemap = self.campaign.advance()
+        if isinstance(previous, StreamingTilemap):
+            previous.close()
+        self.start_state.tilemap = self.tilemap.pristine
+        self.reset_game()
+        self.set_level_caption()
+
+    def quit(self):
+        self.profiler.close()
+        if self.recorder:
+            self.recorder.close()
+        pygame.quit()
+        sys.exit()
 
-            
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
-            self.clock.tick(110)
+    def reset_game(self):
+        self.restore_state(self.start_state)  # player, map, scroll and the game over and winner flags as the level started
+        self.entities.clear()
+        self.level_restarted = True
+
+    # the finished end screen for 'game_over' or 'game_winner', built the first time it is shown
+    def end_screen(self, image_key):
+        if image_key not in self.end_screens:
+            if not self.end_screen_text:
+                pygame.font.init()
+                font = pygame.font.SysFont(None, 25)
+                self.end_screen_text = font.render('Press Y to Play Again or N to Quit', True, (255, 255, 255))
+
+            screen = self.display.copy()
+            screen.blit(self.assets['background'], (0, 0))
+            screen.blit(self.assets[image_key], (35, 0))
+            screen.blit(self.end_screen_text, (50, 210))
+            self.end_screens[image_key] = screen
+        return self.end_screens[image_key]
+
+    # show the game over or winner screen until the player answers
+    # nothing changes on it, so it is drawn once and the loop sleeps in event.wait instead of redrawing every frame
+    def show_end_screen(self, image_key):
+        self.display.blit(self.end_screen(image_key), (0, 0))
+        self.presenter.present()
 
-     
-    # show the player has won on the screen                   
-    def show_winner_game_screen(self):
         while True:
-            self.display.blit(self.assets['background'], (0, 0))
-            self.display.blit(self.assets['game_winner'], (35, 0))
-            pygame.font.init()
-            font = pygame.font.SysFont(None, 25)
-            text = font.render('Press Y to Play Again or N to Quit', True, (255, 255, 255))
-            self.display.blit(text, (50, 210))
-
-            # Ask the user if they want to play again after they win the game
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_y:
-                        print("Resetting game...")  # Debugging  
-                        self.reset_game()           # reset the game back to the orginial state
-                        return  
-                    if event.key == pygame.K_n:  
-                        pygame.quit()
-                        sys.exit()
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
-            self.clock.tick(110)
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                self.quit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_y:
+                    # winning the last level of a campaign plays the pack again from the first level
+                    if image_key == 'game_winner' and self.campaign:
+                        self.next_level()
+                    else:
+                        self.reset_game()  # Reset game state and return to main loop
+                    return
+                if event.key == pygame.K_n:
+                    self.quit()
+
+            # the window was uncovered or resized, put the screen back
+            if event.type in (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE, pygame.WINDOWEXPOSED):
+                pygame.display.update()
+
+    # move the camera a step towards the player and keep the map around it loaded
+    def update_camera(self):
+        scroll_inc = 30
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / scroll_inc
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / scroll_inc
+
+        render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+        self.tilemap.update_stream(render_scroll, self.display.get_size())
+        return render_scroll
+
+    # one frame from an input mask without drawing anything, in the same order run plays a frame
+    def step(self, mask):
+        if mask & INPUT_RESET:
+            self.reset_game()
+        self.previous_pos = tuple(self.player.pos)
+        self.previous_scroll = tuple(self.scroll)
+        self.update_camera()
+        self.player.update(self.tilemap, (bool(mask & INPUT_RIGHT) - bool(mask & INPUT_LEFT), 0))
+        self.entities.update(self.tilemap)
+        if mask & INPUT_JUMP:
+            self.player.jump()
+        self.level_restarted = False
+
+    # the level at this moment, for restarts, checkpoints and replay seeking
+    def snapshot_state(self):
+        return GameSnapshot(self)
+
+    def restore_state(self, state):
+        self.player.restore(state.player)
+        self.tilemap.restore(state.tilemap)
+        self.scroll = list(state.scroll)
+        self.game_over = state.game_over
+        self.game_winner = state.game_winner
+        self.previous_pos = tuple(self.player.pos)
+        self.previous_scroll = tuple(self.scroll)
+
+    # while a replay plays the arrow keys scrub through it instead of moving the player
+    def replay_controls(self, event):
+        if event.key == pygame.K_RIGHT:
+            self.replay.fast_forward(STEPS_PER_SECOND * 5)
+        if event.key == pygame.K_LEFT:
+            self.replay.seek(self.replay.frame - STEPS_PER_SECOND * 5)
+
+    # the input of the next physics step, from the replay or from the keys held down
+    def next_mask(self):
+        if self.replay and not self.replay.finished():
+            return self.replay.next_mask()
+        mask = input_mask(self.movement[0], self.movement[1], self.jump_pressed) | (INPUT_RESET if self.level_restarted else 0)
+        self.jump_pressed = False
+        return mask
+
+    # the level ended and its end screen is up next, a replay that restarts the level skips it
+    def end_screen_due(self):
+        if not (self.game_over or self.game_winner):
+            return False
+        return not self.replay or self.replay.finished() or self.replay.stalled()
 
     def run(self):
         while True:
 
-            # checks to see if the player has died or won the game
-            if self.game_over:
-                self.show_game_over_screen()
-                continue  
-            
-            if self.game_winner:
-                self.show_winner_game_screen()
+            # winning a campaign level goes straight on to the next one, the last one gets the winner screen
+            if self.game_winner and self.campaign and self.campaign.has_next() and self.end_screen_due():
+                self.next_level()
                 continue
-            
 
-            # If the player is not dead or did not win continue displaying the game
-            self.display.blit(self.assets['background'], (0, 0))
-            
-
-            # Handle camera scrolling
-            scroll_inc = 30
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / scroll_inc
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / scroll_inc
-
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+            # checks to see if the player has died or won the game
+            if self.end_screen_due():
+                self.show_end_screen('game_over' if self.game_over else 'game_winner')
+                # the time spent on the end screen is not caught up on
+                self.clock.tick()
+                self.accumulator = 0
+                continue
 
 
-            # Render the tilemap and player
-            self.tilemap.render(self.display, offset=render_scroll)
-            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
-            self.player.render(self.display, offset=render_scroll)
+            # If the player is not dead or did not win continue displaying the game
+            self.profiler.start_frame()
 
+            # a replay is only watched until it runs out, then the keyboard takes over again
+            playing = self.replay and not self.replay.finished()
 
             # Handle movement input
+            self.profiler.section('input')
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    self.quit()
                 if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_F3:
+                        self.profiler.toggle_overlay()
+                    if playing:
+                        self.replay_controls(event)
+                        continue
                     if event.key == pygame.K_LEFT:
                         self.movement[0] = True
                     if event.key == pygame.K_RIGHT:
                         self.movement[1] = True
-                    if event.key == pygame.K_SPACE and self.player.can_jump:
-                        self.player.velocity[1] = -3
-                        self.player.can_jump = False
+                    if event.key == pygame.K_SPACE:
+                        # held over until the next step, however many frames that takes
+                        self.jump_pressed = True
 
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_LEFT or event.key == pygame.K_a:
                         self.movement[0] = False
                     if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
                         self.movement[1] = False
-                        
 
-            # Check if the player has died or won
-            if self.player.death_animation_played:
-                self.game_over = True
-                
-            if self.player.winner_animation_played:
-                self.game_winner = True
 
+            # physics runs in fixed steps, as many as the time since the last frame is worth
+            self.profiler.section('update')
+            while self.accumulator >= 1 and not self.end_screen_due():
+                mask = self.next_mask()
+                self.step(mask)
+                if self.recorder:
+                    self.recorder.record(mask)
+                self.accumulator -= 1
 
-            # Regular screen update
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
-            self.clock.tick(110)
+                # Check if the player has died or won
+                if self.player.death_animation_played:
+                    self.game_over = True
 
+                if self.player.winner_animation_played:
+                    self.game_winner = True
 
 
-Game().run()
+            # Render the tilemap and player part of the way from the previous step to the last one
+            self.profiler.section('tilemap')
+            alpha = min(self.accumulator, 1)
+            render_scroll = (int(self.previous_scroll[0] + (self.scroll[0] - self.previous_scroll[0]) * alpha), int(self.previous_scroll[1] + (self.scroll[1] - self.previous_scroll[1]) * alpha))
+            player_pos = (self.previous_pos[0] + (self.player.pos[0] - self.previous_pos[0]) * alpha, self.previous_pos[1] + (self.player.pos[1] - self.previous_pos[1]) * alpha)
+            self.display.blit(self.assets['background'], (0, 0))
+            self.tilemap.render(self.display, offset=render_scroll)
+            self.profiler.section('entities')
+            self.entities.render(self.display, offset=render_scroll)
+            # the player draws itself at its own pos, shifting the offset by how far it still has to go puts it at player_pos
+            self.player.render(self.display, offset=(render_scroll[0] + self.player.pos[0] - player_pos[0], render_scroll[1] + self.player.pos[1] - player_pos[1]))
+
+
+            # Regular screen update
+            self.profiler.render(self.display)
+            self.profiler.section('present')
+            self.presenter.present()
+            self.profiler.section('wait')
+            self.accumulator = min(self.accumulator + self.clock.tick(self.frame_cap) * STEPS_PER_SECOND / 1000, MAX_STEPS_PER_FRAME)
+            self.profiler.end_frame()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ninja Obstacle Course')
+    parser.add_argument('map', nargs='?', default=None, help='map.json or a binary .nmap map, by default map.json or the map of the replay')
+    parser.add_argument('--stream-radius', type=int, default=None, help='stream a .nmap map, keeping this many chunks around the camera loaded')
+    parser.add_argument('--profile-trace', default=None, help='write the timings of every frame to this JSON lines file')
+    parser.add_argument('--window-size', type=int, nargs=2, default=(640, 480), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--scale-mode', choices=SCALE_MODES, default='stretch', help='how the 350x240 game is scaled to the window')
+    parser.add_argument('--record', default=None, help='record the input of every frame to this .nrpl replay file')
+    parser.add_argument('--replay', default=None, help='play back a .nrpl replay, the arrow keys skip 5 seconds either way')
+    parser.add_argument('--collision', choices=[COLLISION_NEARBY, COLLISION_SWEPT], default=COLLISION_NEARBY, help='swept collisions never let the player pass through tiles, whatever the speed')
+    parser.add_argument('--seek', type=int, default=0, help='start the replay at this frame')
+    parser.add_argument('--campaign', default=None, help='play the maps of a level pack, a directory of maps or a JSON file listing them, one after another')
+    parser.add_argument('--fps', type=int, default=STEPS_PER_SECOND, help='frame cap, 0 draws as many frames as possible, physics always runs at ' + str(STEPS_PER_SECOND) + ' steps per second')
+    args = parser.parse_args()
+    if args.campaign and (args.record or args.replay):
+        parser.error('replays only cover a single map, --campaign cannot be combined with --record or --replay')
+
+    map_path = args.map
+    replay_inputs = None
+    if args.replay:
+        replay_map, replay_inputs = load_replay(args.replay)
+        map_path = map_path or replay_map
+    map_path = map_path or 'map.json'
+
+    game = Game(map_path, stream_radius=args.stream_radius, profile_trace=args.profile_trace, window_size=tuple(args.window_size), scale_mode=args.scale_mode, record_path=args.record, replay_inputs=replay_inputs, collision_mode=args.collision, frame_cap=args.fps, campaign_path=args.campaign)
+    if game.replay and args.seek:
+        game.replay.seek(args.seek)
+    # whatever ends the game, the frames recorded so far are kept
+    try:
+        game.run()
+    finally:
+        if game.recorder:
+            game.recorder.close()
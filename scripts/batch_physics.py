@@ -0,0 +1,162 @@
+# Batched Physics File
+#
+# Simulates many copies of the player on one map at once. Positions and velocities live in
+# NumPy arrays and every step runs the same gravity, axis separated tile collision and
+# lava/trophy checks as PhysicsEntity.update and Player.update, for all entities together.
+# Results match the scalar code exactly, see benchmarks/bench_batch_physics.py.
+
+import numpy as np
+
+from scripts.entities import GRAVITY, MAX_FALL_SPEED, JUMP_VELOCITY, FALL_DEATH_Y
+from scripts.tilemaps import NEIGHBOR_OFFSETS, PHYSICS_EMPTY, PHYSICS_SOLID, PHYSICS_LAVA, PHYSICS_TROPHY
+from scripts.simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, PLAYER_START, PLAYER_SIZE
+
+
+# dense grid of physics kinds covering every physics tile, returns the grid and the tile position of grid[0, 0]
+def solidity_grid(tilemap):
+    if not tilemap.physics_tiles:
+        return np.zeros((1, 1), dtype=np.int8), (0, 0)
+
+    xs = [loc[0] for loc in tilemap.physics_tiles]
+    ys = [loc[1] for loc in tilemap.physics_tiles]
+    origin = (min(xs), min(ys))
+    grid = np.full((max(xs) - origin[0] + 1, max(ys) - origin[1] + 1), PHYSICS_EMPTY, dtype=np.int8)
+    for loc, (kind, _) in tilemap.physics_tiles.items():
+        grid[loc[0] - origin[0], loc[1] - origin[1]] = kind
+    return grid, origin
+
+
+class BatchPhysics:
+    def __init__(self, tilemap, count, pos=PLAYER_START, size=PLAYER_SIZE, max_fall_speed=MAX_FALL_SPEED):
+        self.tile_size = tilemap.tile_size
+        self.grid, self.origin = solidity_grid(tilemap)
+        self.size = size
+        self.count = count
+
+        # pos and max_fall_speed may be a single value or one per entity
+        self.pos = np.empty((count, 2), dtype=np.float64)
+        self.pos[:] = pos
+        self.velocity = np.zeros((count, 2), dtype=np.float64)
+        self.max_fall_speed = np.empty(count, dtype=np.float64)
+        self.max_fall_speed[:] = max_fall_speed
+
+        self.collisions = {direction: np.zeros(count, dtype=bool) for direction in ('up', 'down', 'right', 'left')}
+        self.death_collisions = np.zeros(count, dtype=bool)
+        self.win_collision = np.zeros(count, dtype=bool)
+
+        self.air_time = np.zeros(count, dtype=np.int64)
+        self.can_jump = np.ones(count, dtype=bool)
+        self.is_dead = np.zeros(count, dtype=bool)
+        self.did_win = np.zeros(count, dtype=bool)
+        self.steps = 0
+
+    # entities that are neither dead nor have won still move
+    def alive(self):
+        return ~(self.is_dead | self.did_win)
+
+    # physics kind of each tile position, everything outside the grid is empty
+    def kinds_at(self, tile_x, tile_y):
+        gx = tile_x - self.origin[0]
+        gy = tile_y - self.origin[1]
+        inside = (gx >= 0) & (gx < self.grid.shape[0]) & (gy >= 0) & (gy < self.grid.shape[1])
+        kinds = np.full(tile_x.shape, PHYSICS_EMPTY, dtype=np.int8)
+        kinds[inside] = self.grid[gx[inside], gy[inside]]
+        return kinds
+
+    # one frame of Player.update for every entity, movement is -1, 0 or 1 per entity
+    def update(self, movement):
+        ts = self.tile_size
+        w, h = self.size
+        alive = self.alive()
+        movement = np.broadcast_to(np.asarray(movement, dtype=np.float64), (self.count,))
+
+        # entities that are no longer playing keep the collisions of their last frame, like Player does
+        kept = {side: direction & ~alive for side, direction in self.collisions.items()}
+        for direction in self.collisions.values():
+            direction[:] = False
+
+        frame_x = movement + self.velocity[:, 0]
+        frame_y = self.velocity[:, 1]
+
+        # horizontal movement, the neighbourhood is taken after moving like physics_rects_around
+        pos_x = self.pos[:, 0] + frame_x
+        pos_y = self.pos[:, 1]
+        tile_x = np.floor_divide(pos_x, ts).astype(np.int64)
+        tile_y = np.floor_divide(pos_y, ts).astype(np.int64)
+
+        # pygame.Rect truncates float positions towards zero
+        rect_x = np.trunc(pos_x).astype(np.int64)
+        rect_y = np.trunc(pos_y).astype(np.int64)
+
+        neighbors = []
+        for offset in NEIGHBOR_OFFSETS:
+            kinds = self.kinds_at(tile_x + offset[0], tile_y + offset[1])
+            neighbors.append(((tile_x + offset[0]) * ts, (tile_y + offset[1]) * ts, kinds == PHYSICS_SOLID))
+
+        # rects are resolved one after another in NEIGHBOR_OFFSETS order, exactly like the scalar loop
+        for tile_left, tile_top, solid in neighbors:
+            hit = solid & (rect_x < tile_left + ts) & (rect_y < tile_top + ts) & (rect_x + w > tile_left) & (rect_y + h > tile_top)
+            hit_right = hit & (frame_x > 0)
+            hit_left = hit & (frame_x < 0)
+            rect_x = np.where(hit_right, tile_left - w, rect_x)
+            rect_x = np.where(hit_left, tile_left + ts, rect_x)
+            self.collisions['right'] |= hit_right
+            self.collisions['left'] |= hit_left
+            pos_x = np.where(hit, rect_x, pos_x)
+
+        # vertical movement against the same rects
+        pos_y = pos_y + frame_y
+        rect_x = np.trunc(pos_x).astype(np.int64)
+        rect_y = np.trunc(pos_y).astype(np.int64)
+        for tile_left, tile_top, solid in neighbors:
+            hit = solid & (rect_x < tile_left + ts) & (rect_y < tile_top + ts) & (rect_x + w > tile_left) & (rect_y + h > tile_top)
+            hit_down = hit & (frame_y > 0)
+            hit_up = hit & (frame_y < 0)
+            rect_y = np.where(hit_down, tile_top - h, rect_y)
+            rect_y = np.where(hit_up, tile_top + ts, rect_y)
+            self.collisions['down'] |= hit_down
+            self.collisions['up'] |= hit_up
+            pos_y = np.where(hit, rect_y, pos_y)
+
+        # lava and the trophy around where each entity ends up
+        tile_x = np.floor_divide(pos_x, ts).astype(np.int64)
+        tile_y = np.floor_divide(pos_y, ts).astype(np.int64)
+        death = np.zeros(self.count, dtype=bool)
+        winner = np.zeros(self.count, dtype=bool)
+        for offset in NEIGHBOR_OFFSETS:
+            kinds = self.kinds_at(tile_x + offset[0], tile_y + offset[1])
+            death |= kinds == PHYSICS_LAVA
+            winner |= kinds == PHYSICS_TROPHY
+
+        velocity_y = np.minimum(self.max_fall_speed, self.velocity[:, 1] + GRAVITY)
+        velocity_y = np.where(self.collisions['down'] | self.collisions['up'], 0, velocity_y)
+
+        # only entities that are still playing move, the others keep their last state
+        self.pos[:, 0] = np.where(alive, pos_x, self.pos[:, 0])
+        self.pos[:, 1] = np.where(alive, pos_y, self.pos[:, 1])
+        self.velocity[:, 1] = np.where(alive, velocity_y, self.velocity[:, 1])
+        for side, direction in self.collisions.items():
+            direction &= alive
+            direction |= kept[side]
+        self.death_collisions = np.where(alive, death, self.death_collisions)
+        self.win_collision = np.where(alive, winner, self.win_collision)
+
+        landed = alive & self.collisions['down']
+        self.air_time = np.where(landed, 0, np.where(alive, self.air_time + 1, self.air_time))
+        self.can_jump |= landed
+
+        self.is_dead |= alive & ((self.pos[:, 1] > FALL_DEATH_Y) | self.death_collisions)
+        self.did_win |= alive & self.win_collision
+        self.steps += 1
+
+    # the vectorised Player.jump
+    def jump(self, jumping):
+        jumping = np.asarray(jumping, dtype=bool) & self.can_jump
+        self.velocity[:, 1] = np.where(jumping, JUMP_VELOCITY, self.velocity[:, 1])
+        self.can_jump &= ~jumping
+
+    # advance one frame from per entity input masks, in the same order as HeadlessGame.step
+    def step(self, masks):
+        masks = np.asarray(masks)
+        self.update(((masks & INPUT_RIGHT) != 0).astype(np.int64) - ((masks & INPUT_LEFT) != 0))
+        self.jump((masks & INPUT_JUMP) != 0)
@@ -0,0 +1,91 @@
+# Campaign File
+#
+# A level pack is a list of maps played one after another, and winning a level moves on to the
+# next one. The pack is either a directory of maps played in name order, or a JSON file that lists
+# them:
+#
+#     {"name": "Ninja Obstacle Course", "levels": ["levels/1.json", "levels/2.json", "levels/3.nmap"]}
+#
+# While a level is played, the next one is loaded on a background thread. That covers its tiles,
+# its physics and the chunks the camera starts on, so moving on only swaps the tilemap in. The
+# thread draws with its own copies of the tile images, pygame surfaces are never used by both
+# threads at once. After the last level the pack starts over from the first.
+#
+#     python main.py --campaign levels/
+
+import json
+import os
+import threading
+
+import pygame
+
+from scripts.mapformat import is_binary_map
+
+
+# the map paths of a level pack, in the order they are played
+def load_level_pack(path):
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json') or is_binary_map(name)]
+
+    f = open(path, 'r')
+    pack = json.load(f)
+    f.close()
+    # level paths are relative to the pack file
+    return [os.path.join(os.path.dirname(path), level) for level in pack['levels']]
+
+
+# the tile images a level is drawn with, copied on the main thread for a level loaded on the prefetch thread
+# the game's own are subsurfaces of the atlas the main thread draws from every frame
+class LevelAssets:
+    def __init__(self, assets):
+        self.assets = {key: [img.copy() for img in images] for key, images in assets.items() if isinstance(images, list)}
+
+
+class Campaign:
+    def __init__(self, game, levels):
+        if not levels:
+            raise ValueError('a level pack needs at least one level')
+        self.game = game
+        self.levels = levels
+        self.level = 0
+
+        # the next level's tilemap once the background thread has it ready, or what went wrong loading it
+        self.prefetcher = None
+        self.next_tilemap = None
+        self.next_error = None
+
+    def has_next(self):
+        return self.level + 1 < len(self.levels)
+
+    # the level played after the current one, the first one again after the last
+    def next_level(self):
+        return (self.level + 1) % len(self.levels)
+
+    # start loading the level after the current one
+    def prefetch(self):
+        self.next_tilemap = None
+        self.next_error = None
+        self.prefetcher = threading.Thread(target=self.prepare, args=(self.levels[self.next_level()], LevelAssets(self.game.assets)), daemon=True)
+        self.prefetcher.start()
+
+    def prepare(self, map_path, assets):
+        try:
+            tilemap = self.game.load_tilemap(map_path, assets)
+
+            # build the chunks the camera starts on, so the first frame of the level does not have to
+            view = pygame.Surface(self.game.display.get_size())
+            tilemap.update_stream((0, 0), view.get_size())
+            tilemap.render(view)
+            self.next_tilemap = tilemap
+        except Exception as error:
+            self.next_error = error
+
+    # the tilemap of the next level, only waits if the player got there before it finished loading
+    def advance(self):
+        self.prefetcher.join()
+        if self.next_error:
+            raise self.next_error
+        tilemap = self.next_tilemap
+        self.level = self.next_level()
+        self.prefetch()
+        return tilemap
@@ -2,8 +2,33 @@
 
 import pygame
 
+from scripts.tilemaps import PHYSICS_SOLID
+
+# how PhysicsEntity.update finds the tiles it collides with
+# 'nearby' only looks at the 3x3 tiles around where the entity ends up, which is enough while it moves less than a tile per frame
+# 'swept' walks every row or column of tiles the entity passes through, so it can move any distance without going through walls
+COLLISION_NEARBY = 'nearby'
+COLLISION_SWEPT = 'swept'
+
+# the player's movement, also used by the navigation index to work out where the player can get to
+GRAVITY = 0.1
+MAX_FALL_SPEED = 5
+JUMP_VELOCITY = -3
+FALL_DEATH_Y = 480
+
+# the attributes Player keeps on top of PhysicsEntity
+PLAYER_STATE = ('air_time', 'is_dead', 'did_win', 'win_timer', 'death_timer', 'can_jump', 'death_animation_played', 'winner_animation_played')
+
+
+# the moving state of an entity at one moment, the animation is kept as the Animation it was playing plus its frame
+class EntitySnapshot:
+    __slots__ = ('pos', 'velocity', 'collisions', 'death_collisions', 'win_collision', 'action', 'animation', 'animation_frame', 'animation_done', 'flip', 'extra')
+
 class PhysicsEntity:
-    def __init__(self, game, e_type, pos, size):
+    # fixed attributes instead of a __dict__ per entity, subclasses add their own
+    __slots__ = ('game', 'type', 'pos', 'size', 'velocity', 'collisions', 'death_collisions', 'win_collision', 'collision_mode', 'max_fall_speed', 'action', 'anim_offset', 'flip', 'animation')
+
+    def __init__(self, game, e_type, pos, size, collision_mode=COLLISION_NEARBY, max_fall_speed=MAX_FALL_SPEED):
         self.game = game
         self.type = e_type
         self.pos = list(pos)
@@ -13,6 +38,9 @@ class PhysicsEntity:
         self.death_collisions = False
         self.win_collision =  False
 
+        self.collision_mode = collision_mode
+        self.max_fall_speed = max_fall_speed
+
         self.action = ''
         self.anim_offset = (-6, -14)
         self.flip = False
@@ -26,15 +54,63 @@ class PhysicsEntity:
             self.action = action
             self.animation = self.game.assets[self.type + '/' + self.action].copy()
 
+    # put a pooled entity back into play somewhere else, reusing its lists, dict and animation
+    def respawn(self, pos, size=None):
+        self.pos[0] = pos[0]
+        self.pos[1] = pos[1]
+        if size is not None:
+            self.size = size
+        self.velocity[0] = 0
+        self.velocity[1] = 0
+        for side in self.collisions:
+            self.collisions[side] = False
+        self.death_collisions = False
+        self.win_collision = False
+        self.flip = False
+        if self.action == 'idle':
+            self.animation.frame = 0
+            self.animation.done = False
+        else:
+            self.set_action('idle')
+
     def update(self, tilemap, movement=(0, 0)):
-        self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
+        self.move(tilemap, movement)
+
+        # flip the player animation depending on the direction they are moving
+        if movement[0] > 0:
+            self.flip = False
+        if movement[0] < 0:
+            self.flip = True
+
+        self.animation.update()
+
+    # one frame of movement, collisions and gravity without touching the animation
+    def move(self, tilemap, movement=(0, 0)):
+        # cleared in place, every frame used to build a new dict
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['right'] = collisions['left'] = False
 
         frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])
 
+        if self.collision_mode == COLLISION_SWEPT:
+            self.move_swept(tilemap, frame_movement)
+        else:
+            self.move_nearby(tilemap, frame_movement)
+
+        # lava and the trophy are checked around where the entity ends up, the query for that tile is usually cached
+        _, self.death_collisions, self.win_collision = tilemap.physics_rects_around(self.pos)
+
+        self.velocity[1] = min(self.max_fall_speed, self.velocity[1] + GRAVITY)
+
+
+        if self.collisions['down'] or self.collisions['up']:
+            self.velocity[1] = 0
+
+    def move_nearby(self, tilemap, frame_movement):
         # Horizontal movement and collision
         self.pos[0] += frame_movement[0]
         entity_rect = self.rect()
-        rects, _ , _= tilemap.physics_rects_around(self.pos) # tile collision and collision with lava
+        rects, _, _ = tilemap.physics_rects_around(self.pos) # tile collision for the whole frame
         
         for rect in rects:
             if entity_rect.colliderect(rect):
@@ -63,30 +139,83 @@ class PhysicsEntity:
                     self.collisions['up'] = True
                 self.pos[1] = entity_rect.y
 
+    def move_swept(self, tilemap, frame_movement):
+        self.sweep(tilemap, 0, frame_movement[0])
+        self.sweep(tilemap, 1, frame_movement[1])
 
-        # flip the player animation depending on the direction they are moving
-        if movement[0] > 0:
-            self.flip = False
-        if movement[0] < 0:
-            self.flip = True
-
-        
-        self.velocity[1] = min(5, self.velocity[1] + 0.1)
+    # move along one axis (0 is x, 1 is y), walking the tile columns or rows the entity passes through in order
+    # and stopping against the first one with a solid tile across the entity's extent, like a DDA grid traversal
+    def sweep(self, tilemap, axis, distance):
+        start = self.rect()
+        self.pos[axis] += distance
+        end = self.rect()
 
+        size = tilemap.tile_size
+        low = min(start[axis], end[axis])
+        high = max(start[axis], end[axis]) + end[axis + 2]
+        lines = range(low // size, (high - 1) // size + 1)
+        if distance < 0:
+            lines = reversed(lines)
+        across = range(end[1 - axis] // size, (end[1 - axis] + end[3 - axis] - 1) // size + 1)
 
-        if self.collisions['down'] or self.collisions['up']:
-            self.velocity[1] = 0
+        for line in lines:
+            for cross in across:
+                physics_tile = tilemap.physics_tiles.get((line, cross) if axis == 0 else (cross, line))
+                if physics_tile and physics_tile[0] == PHYSICS_SOLID:
+                    break
+            else:
+                continue
 
-        self.animation.update()
+            if distance > 0:
+                self.pos[axis] = line * size - end[axis + 2]
+                self.collisions['right' if axis == 0 else 'down'] = True
+            elif distance < 0:
+                self.pos[axis] = (line + 1) * size
+                self.collisions['left' if axis == 0 else 'up'] = True
+            else:
+                self.pos[axis] = end[axis]
+            return
 
 
     def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        surf.blit(self.animation.img(self.flip), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+
+    # everything about the entity that changes while it moves, restore puts it back exactly
+    def snapshot(self):
+        snapshot = EntitySnapshot()
+        snapshot.pos = tuple(self.pos)
+        snapshot.velocity = tuple(self.velocity)
+        snapshot.collisions = tuple(self.collisions.items())
+        snapshot.death_collisions = self.death_collisions
+        snapshot.win_collision = self.win_collision
+        snapshot.action = self.action
+        snapshot.animation = self.animation
+        snapshot.animation_frame = self.animation.frame
+        snapshot.animation_done = self.animation.done
+        snapshot.flip = self.flip
+        snapshot.extra = ()
+        return snapshot
+
+    # no assets are looked up, a different animation is copied from the one the snapshot kept
+    def restore(self, snapshot):
+        self.pos = list(snapshot.pos)
+        self.velocity = list(snapshot.velocity)
+        self.collisions.update(snapshot.collisions)
+        self.death_collisions = snapshot.death_collisions
+        self.win_collision = snapshot.win_collision
+        self.action = snapshot.action
+        if self.animation is not snapshot.animation:
+            self.animation = snapshot.animation.copy()
+        self.animation.frame = snapshot.animation_frame
+        self.animation.done = snapshot.animation_done
+        self.flip = snapshot.flip
 
 
 class Player(PhysicsEntity):
-    def __init__(self, game, pos, size):
-        super().__init__(game, 'player', pos, size)
+    __slots__ = PLAYER_STATE
+
+    def __init__(self, game, pos, size, collision_mode=COLLISION_NEARBY, max_fall_speed=MAX_FALL_SPEED):
+        super().__init__(game, 'player', pos, size, collision_mode=collision_mode, max_fall_speed=max_fall_speed)
         self.air_time = 0
         
         self.is_dead = False     
@@ -125,14 +254,13 @@ class Player(PhysicsEntity):
 
             
             #check to see if the player fell of the map and update the action 
-            if self.pos[1] > 480:
+            if self.pos[1] > FALL_DEATH_Y:
                 self.is_dead = True
                 self.death_timer = 30
                 self.set_action('death')
             
               
-            rects, death, winner = tilemap.physics_rects_around(self.pos)
-            if death:
+            if self.death_collisions:
                 # checks to see if the death animation is played
                 if not self.death_animation_played:
                     self.is_dead = True  
@@ -140,7 +268,7 @@ class Player(PhysicsEntity):
                     self.set_action('death')
                     
            
-            if winner:
+            if self.win_collision:
                 # checks to see if the winner animation is played
                 if not self.winner_animation_played:
                     self.did_win = True
@@ -172,18 +300,23 @@ class Player(PhysicsEntity):
             
               
                  
+    # jump if the player is standing on something
+    def jump(self):
+        if self.can_jump:
+            self.velocity[1] = JUMP_VELOCITY
+            self.can_jump = False
+
+
     def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        surf.blit(self.animation.img(self.flip), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
        
     
-    # Reset everything to original value after the player dies or wins the game
-    def reset(self):
-        self.is_dead = False
-        self.did_win = False
-        
-        self.death_animation_played = False
-        self.winner_animation_played = False
-        
-        self.pos = [50, 50]  
-        self.velocity = [0, 0]  
-        self.set_action('idle')  
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot.extra = tuple(getattr(self, name) for name in PLAYER_STATE)
+        return snapshot
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        for name, value in zip(PLAYER_STATE, snapshot.extra):
+            setattr(self, name, value)
@@ -0,0 +1,143 @@
+# Entity Manager File
+#
+# Owns every live PhysicsEntity besides the player: enemies, projectiles and anything else a level
+# spawns. Entities that are despawned go back into a pool per class and type and are reused by the
+# next spawn instead of allocating new ones. After every update the live entities are sorted into
+# a uniform grid so overlap queries only look at entities in nearby cells.
+
+from scripts.entities import PhysicsEntity
+
+
+class EntityManager:
+    def __init__(self, game, cell_size=32):
+        self.game = game
+        self.cell_size = cell_size
+
+        # live entities in spawn order and the rect of each one as of the last update
+        self.entities = []
+        self.rects = []
+
+        # (class, type) -> despawned entities waiting to be reused
+        self.pools = {}
+        self.despawned = set()
+
+        # grid cell -> indices into entities, the lists of occupied cells are cleared and reused every update
+        self.grid = {}
+
+        # how far any spawned entity's sprite reaches past its rect, the render query is widened by this
+        self.sprite_margin = 0
+
+    # a new or recycled entity at pos, classes other than PhysicsEntity take the same constructor arguments
+    def spawn(self, e_type, pos, size, entity_class=PhysicsEntity):
+        pool = self.pools.get((entity_class, e_type))
+        if pool:
+            entity = pool.pop()
+            # pools are shared by every size of a type, a reused entity takes the size it is spawned with
+            resized = tuple(entity.size) != tuple(size)
+            entity.respawn(pos, size)
+        else:
+            entity = entity_class(self.game, e_type, pos, size)
+            resized = True
+        if resized:
+            self.sprite_margin = max(self.sprite_margin, self.sprite_extent(entity))
+        self.entities.append(entity)
+        self.rects.append(entity.rect())
+        self.index(len(self.entities) - 1)
+        return entity
+
+    # the entity stays in play until the end of the current update, then goes back to its pool
+    def despawn(self, entity):
+        self.despawned.add(entity)
+
+    def update(self, tilemap):
+        for entity in self.entities:
+            entity.update(tilemap)
+        self.release_despawned()
+        self.rebuild_grid()
+
+    # move despawned entities into their pools
+    def release_despawned(self):
+        if not self.despawned:
+            return
+        live = []
+        for entity in self.entities:
+            if entity in self.despawned:
+                self.pools.setdefault((type(entity), entity.type), []).append(entity)
+            else:
+                live.append(entity)
+        self.entities = live
+        self.despawned.clear()
+
+    # the rects are moved in place, pygame truncates like entity.rect() only when constructing, hence the int()
+    def rebuild_grid(self):
+        for cell in self.grid.values():
+            cell.clear()
+        rects = self.rects
+        del rects[len(self.entities):]
+        for i, entity in enumerate(self.entities):
+            if i < len(rects):
+                rect = rects[i]
+                rect.x = int(entity.pos[0])
+                rect.y = int(entity.pos[1])
+                rect.width = entity.size[0]
+                rect.height = entity.size[1]
+            else:
+                rects.append(entity.rect())
+            self.index(i)
+
+        # cells nothing is in any more would otherwise pile up as entities wander the level
+        for cell in [cell for cell, indices in self.grid.items() if not indices]:
+            del self.grid[cell]
+
+    # the furthest any frame of the entity's animations reaches past its rect on any side
+    def sprite_extent(self, entity):
+        prefix = entity.type + '/'
+        extent = 0
+        for key, animation in self.game.assets.items():
+            if key.startswith(prefix):
+                for img in animation.images:
+                    extent = max(extent, -entity.anim_offset[0], -entity.anim_offset[1], entity.anim_offset[0] + img.get_width() - entity.size[0], entity.anim_offset[1] + img.get_height() - entity.size[1])
+        return extent
+
+    def cells(self, rect):
+        size = self.cell_size
+        return [(cx, cy) for cx in range(rect.left // size, (rect.right - 1) // size + 1) for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+
+    def index(self, i):
+        for cell in self.cells(self.rects[i]):
+            if cell not in self.grid:
+                self.grid[cell] = []
+            self.grid[cell].append(i)
+
+    # live entities whose rect overlaps rect, in spawn order
+    def query(self, rect):
+        found = set()
+        for cell in self.cells(rect):
+            for i in self.grid.get(cell, ()):
+                if i not in found and self.rects[i].colliderect(rect):
+                    found.add(i)
+        return [self.entities[i] for i in sorted(found)]
+
+    # every pair of live entities that overlap, each pair once
+    def overlapping_pairs(self):
+        pairs = set()
+        for cell in self.grid.values():
+            for a in range(len(cell)):
+                for b in range(a + 1, len(cell)):
+                    i, j = cell[a], cell[b]
+                    if self.rects[i].colliderect(self.rects[j]):
+                        pairs.add((i, j) if i < j else (j, i))
+        return [(self.entities[i], self.entities[j]) for i, j in sorted(pairs)]
+
+    # only entities in view are drawn, sprites are bigger than the rects so the view is widened to catch them
+    def render(self, surf, offset=(0, 0)):
+        view = surf.get_rect(topleft=offset).inflate(self.sprite_margin * 2, self.sprite_margin * 2)
+        for entity in self.query(view):
+            entity.render(surf, offset=offset)
+
+    # despawn everything, for level restarts
+    def clear(self):
+        for entity in self.entities:
+            self.despawn(entity)
+        self.release_despawned()
+        self.rebuild_grid()
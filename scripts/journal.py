@@ -0,0 +1,144 @@
+# Edit Journal File
+#
+# Records every change made to a tilemap as a small operation. The operations give the editor
+# multi-level undo and redo, and they are appended to a journal file next to the map every few
+# seconds so an autosave only writes what changed. An explicit save writes the whole map once and
+# empties the journal again. Loading a map replays a journal left behind by an unsaved session.
+#
+# Journal lines are JSON lists:
+#     ["t", x, y, type, variant]              grid tile placed
+#     ["t", x, y]                             grid tile removed
+#     ["o+", index, x, y, type, variant]      offgrid tile added at that draw order index
+#     ["o-", index]                           offgrid tile at that index removed
+
+import json
+import os
+import time
+from collections import deque
+
+JOURNAL_SUFFIX = '.journal'
+
+
+class EditJournal:
+    def __init__(self, tilemap, map_path, autosave_interval=5.0, max_undo=500):
+        self.tilemap = tilemap
+        self.map_path = map_path
+        self.path = map_path + JOURNAL_SUFFIX
+        self.autosave_interval = autosave_interval
+        self.last_autosave = time.monotonic()
+
+        # undo and redo steps are lists of operations, an operation is ('tile', loc, before, after) or ('offgrid', index, (pos, type, variant), added)
+        self.undo_steps = deque(maxlen=max_undo)
+        self.redo_steps = []
+        self.current = []
+
+        # journal lines not written to disk yet
+        self.pending = []
+        self.recording = True
+
+        tilemap.journal = self
+
+    def record_tile(self, loc, before, after):
+        if self.recording:
+            self.current.append(('tile', loc, before, after))
+            self.redo_steps = []
+        self.pending.append(['t', loc[0], loc[1]] + (list(after) if after else []))
+
+    def record_offgrid(self, index, tile, added):
+        if self.recording:
+            self.current.append(('offgrid', index, (tile.pos, tile.type, tile.variant), added))
+            self.redo_steps = []
+        if added:
+            self.pending.append(['o+', index, tile.pos[0], tile.pos[1], tile.type, tile.variant])
+        else:
+            self.pending.append(['o-', index])
+
+    # close the current step, everything recorded since the last checkpoint is undone together
+    def checkpoint(self):
+        if self.current:
+            self.undo_steps.append(self.current)
+            self.current = []
+
+    def apply(self, operation, reverse=False):
+        if operation[0] == 'tile':
+            _, loc, before, after = operation
+            state = before if reverse else after
+            if state:
+                self.tilemap.set_tile(loc, state[0], state[1])
+            else:
+                self.tilemap.remove_tile(loc)
+        else:
+            _, index, (pos, tile_type, variant), added = operation
+            if added != reverse:
+                self.tilemap.add_offgrid(tile_type, variant, pos, index=index)
+            else:
+                self.tilemap.remove_offgrid(self.tilemap.offgrid_tiles[index])
+
+    # replay operations without recording them as new undo steps, they still go to the journal file
+    def replay(self, operations, reverse=False):
+        self.recording = False
+        for operation in (reversed(operations) if reverse else operations):
+            self.apply(operation, reverse=reverse)
+        self.recording = True
+
+    def undo(self):
+        self.checkpoint()
+        if self.undo_steps:
+            step = self.undo_steps.pop()
+            self.replay(step, reverse=True)
+            self.redo_steps.append(step)
+
+    def redo(self):
+        self.checkpoint()
+        if self.redo_steps:
+            step = self.redo_steps.pop()
+            self.replay(step)
+            self.undo_steps.append(step)
+
+    # append the pending operations to the journal file
+    def flush(self):
+        if self.pending:
+            f = open(self.path, 'a')
+            f.write(''.join(json.dumps(line) + '\n' for line in self.pending))
+            f.close()
+            self.pending = []
+        self.last_autosave = time.monotonic()
+
+    # call every frame, flushes once the autosave interval has passed
+    def autosave(self):
+        if time.monotonic() - self.last_autosave >= self.autosave_interval:
+            self.flush()
+
+    # write the whole map and start an empty journal, the compacted map is all that is needed now
+    def save(self):
+        self.tilemap.save(self.map_path)
+        self.pending = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.last_autosave = time.monotonic()
+
+    # apply a journal left behind by a session that was never saved, returns how many operations it had
+    def recover(self):
+        if not os.path.exists(self.path):
+            return 0
+        f = open(self.path, 'r')
+        lines = [json.loads(line) for line in f if line.strip()]
+        f.close()
+
+        self.recording = False
+        pending = self.pending
+        self.pending = []
+        for line in lines:
+            if line[0] == 't':
+                if len(line) > 3:
+                    self.tilemap.set_tile((line[1], line[2]), line[3], line[4])
+                else:
+                    self.tilemap.remove_tile((line[1], line[2]))
+            elif line[0] == 'o+':
+                self.tilemap.add_offgrid(line[4], line[5], (line[2], line[3]), index=line[1])
+            elif line[0] == 'o-':
+                self.tilemap.remove_offgrid(self.tilemap.offgrid_tiles[line[1]])
+        # the recovered lines are already in the file
+        self.pending = pending
+        self.recording = True
+        return len(lines)
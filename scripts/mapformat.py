@@ -0,0 +1,142 @@
+# Binary Map Format File
+#
+# A compact alternative to map.json. Grid tiles are stored per chunk as two typed byte arrays
+# (tile type index and variant for every cell) behind a directory of chunk offsets, so a reader
+# can memory map the file and decode only the chunks it needs. Offgrid tiles follow as a list.
+#
+# Convert between the formats with:
+#
+#     python -m scripts.mapformat map.json map.nmap
+#     python -m scripts.mapformat map.nmap map.json
+#
+# Layout, all little endian:
+#     header     magic 'NMAP', version, tile size, chunk size, type count, chunk count, offgrid count
+#     types      per type: name length (u8) + utf-8 name
+#     directory  per chunk: chunk x (i32), chunk y (i32), byte offset of the chunk data (u64)
+#     offgrid    per tile: type (u8), variant (u8), x (f64), y (f64)
+#     chunks     per chunk: chunk_size * chunk_size type bytes then as many variant bytes
+
+import mmap
+import struct
+import sys
+
+BINARY_MAP_EXTENSION = '.nmap'
+
+MAGIC = b'NMAP'
+VERSION = 1
+EMPTY = 255
+
+HEADER = struct.Struct('<4sHHHHII')
+DIRECTORY_ENTRY = struct.Struct('<iiQ')
+OFFGRID_ENTRY = struct.Struct('<BBdd')
+
+
+def is_binary_map(path):
+    return path.endswith(BINARY_MAP_EXTENSION)
+
+
+# tiles is an iterable of (x, y, type, variant) and offgrid of (x, y, type, variant) in pixels
+def write_map(path, tile_size, tiles, offgrid, chunk_size=16):
+    types = []
+    chunks = {}
+    for x, y, tile_type, variant in tiles:
+        if tile_type not in types:
+            types.append(tile_type)
+        chunk_loc = (x // chunk_size, y // chunk_size)
+        if chunk_loc not in chunks:
+            chunks[chunk_loc] = (bytearray([EMPTY]) * (chunk_size * chunk_size), bytearray(chunk_size * chunk_size))
+        cell = (y % chunk_size) * chunk_size + (x % chunk_size)
+        chunks[chunk_loc][0][cell] = types.index(tile_type)
+        chunks[chunk_loc][1][cell] = variant
+    offgrid = list(offgrid)
+    for _, _, tile_type, _ in offgrid:
+        if tile_type not in types:
+            types.append(tile_type)
+
+    type_table = b''.join(struct.pack('<B', len(name.encode())) + name.encode() for name in types)
+    data_start = HEADER.size + len(type_table) + DIRECTORY_ENTRY.size * len(chunks) + OFFGRID_ENTRY.size * len(offgrid)
+    chunk_bytes = 2 * chunk_size * chunk_size
+
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAGIC, VERSION, tile_size, chunk_size, len(types), len(chunks), len(offgrid)))
+    f.write(type_table)
+    for i, chunk_loc in enumerate(sorted(chunks)):
+        f.write(DIRECTORY_ENTRY.pack(chunk_loc[0], chunk_loc[1], data_start + i * chunk_bytes))
+    for x, y, tile_type, variant in offgrid:
+        f.write(OFFGRID_ENTRY.pack(types.index(tile_type), variant, x, y))
+    for chunk_loc in sorted(chunks):
+        f.write(chunks[chunk_loc][0])
+        f.write(chunks[chunk_loc][1])
+    f.close()
+
+
+# Reads a binary map lazily from a memory mapped file
+class MapFile:
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+
+        magic, version, self.tile_size, self.chunk_size, type_count, chunk_count, offgrid_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + ' is not a version ' + str(VERSION) + ' binary map')
+
+        offset = HEADER.size
+        self.types = []
+        for _ in range(type_count):
+            length = self.data[offset]
+            self.types.append(self.data[offset + 1:offset + 1 + length].decode())
+            offset += 1 + length
+
+        # chunk position -> byte offset of its data
+        self.directory = {}
+        for _ in range(chunk_count):
+            cx, cy, chunk_offset = DIRECTORY_ENTRY.unpack_from(self.data, offset)
+            self.directory[(cx, cy)] = chunk_offset
+            offset += DIRECTORY_ENTRY.size
+
+        self.offgrid_offset = offset
+        self.offgrid_count = offgrid_count
+
+    def chunks(self):
+        return list(self.directory)
+
+    # (x, y, type, variant) of every tile in a chunk, empty if the chunk is not in the file
+    def chunk_tiles(self, chunk_loc):
+        if chunk_loc not in self.directory:
+            return []
+        cells = self.chunk_size * self.chunk_size
+        start = self.directory[chunk_loc]
+        types = self.data[start:start + cells]
+        variants = self.data[start + cells:start + 2 * cells]
+
+        tiles = []
+        base_x = chunk_loc[0] * self.chunk_size
+        base_y = chunk_loc[1] * self.chunk_size
+        for cell in range(cells):
+            if types[cell] != EMPTY:
+                tiles.append((base_x + cell % self.chunk_size, base_y + cell // self.chunk_size, self.types[types[cell]], variants[cell]))
+        return tiles
+
+    # (x, y, type, variant) of every offgrid tile in pixels
+    def offgrid(self):
+        tiles = []
+        for i in range(self.offgrid_count):
+            type_index, variant, x, y = OFFGRID_ENTRY.unpack_from(self.data, self.offgrid_offset + i * OFFGRID_ENTRY.size)
+            tiles.append((x, y, self.types[type_index], variant))
+        return tiles
+
+    def close(self):
+        self.data.close()
+
+
+if __name__ == '__main__':
+    from scripts.tilemaps import Tilemap
+
+    if len(sys.argv) != 3:
+        print('usage: python -m scripts.mapformat SOURCE DESTINATION')
+        sys.exit(1)
+    tilemap = Tilemap(None)
+    tilemap.load(sys.argv[1])
+    tilemap.save(sys.argv[2])
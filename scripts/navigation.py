@@ -0,0 +1,423 @@
+# Navigation File
+#
+# Works out offline where the player can get to on a map. Every empty cell with a solid tile under
+# it is a node the player can stand in, and the edges between nodes are walks, falls and jumps.
+# Each edge is found by running the player's own movement (PhysicsEntity.move with the jump and
+# gravity of Player) from a standing position with a fixed pattern of inputs. That means an edge is
+# exactly the input masks that make the move, and a bot standing in the same place can play them
+# back.
+#
+# The index is kept on the tilemap until the map is edited. It is also saved next to the map file
+# under a hash of its physics tiles, so an unchanged map is never probed twice.
+#
+#     python -m scripts.navigation map.json
+
+import hashlib
+import heapq
+import json
+import os
+import sys
+import threading
+
+from scripts.entities import PhysicsEntity, COLLISION_NEARBY, MAX_FALL_SPEED, JUMP_VELOCITY, FALL_DEATH_Y
+from scripts.tilemaps import Tilemap, PHYSICS_SOLID
+from scripts.simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, PLAYER_START, PLAYER_SIZE
+
+NAVIGATION_SUFFIX = '.nav'
+NAVIGATION_VERSION = 3
+
+# the goal node, reached by any edge that touches the trophy
+TROPHY = 'trophy'
+
+# a probe that has not landed after this many frames is given up on
+MAX_PROBE_FRAMES = 300
+
+# the input patterns tried from every node, for both directions
+#     ('walk',)                    hold the direction until standing in another cell
+#     ('walk_off', jump)           hold it until falling off a ledge, then let go, or jump since can_jump is still set
+#     ('jump', delay, hold)        jump, and hold the direction from frame delay for hold frames
+PATTERNS = [
+    ('walk',),
+    ('walk_off', False),
+    ('walk_off', True),
+    ('jump', 0, MAX_PROBE_FRAMES),
+    ('jump', 0, 16),
+    ('jump', 0, 32),
+    ('jump', 16, MAX_PROBE_FRAMES),
+    ('jump', 30, MAX_PROBE_FRAMES),
+]
+
+
+# a move from one node to another, the player starts standing at x = start_x with masks still to play
+class NavigationEdge:
+    __slots__ = ('source', 'target', 'start_x', 'masks')
+
+    def __init__(self, source, target, start_x, masks):
+        self.source = source
+        self.target = target
+        self.start_x = start_x
+        self.masks = masks
+
+    def cost(self):
+        return len(self.masks)
+
+
+# the player's collision box and jump without a game or animations behind it
+class NavigationProbe(PhysicsEntity):
+    __slots__ = ('can_jump',)
+
+    def __init__(self, pos, collision_mode=COLLISION_NEARBY):
+        self.pos = list(pos)
+        self.size = PLAYER_SIZE
+        self.velocity = [0, 0]
+        self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
+        self.death_collisions = False
+        self.win_collision = False
+        self.collision_mode = collision_mode
+        self.max_fall_speed = MAX_FALL_SPEED
+        self.can_jump = True
+
+    # one frame the way Game.step plays it, Player.update and then the jump key
+    def step(self, tilemap, mask):
+        self.move(tilemap, (bool(mask & INPUT_RIGHT) - bool(mask & INPUT_LEFT), 0))
+        if self.collisions['down']:
+            self.can_jump = True
+        if mask & INPUT_JUMP and self.can_jump:
+            self.velocity[1] = JUMP_VELOCITY
+            self.can_jump = False
+
+
+# every cell without a physics tile that has a solid tile right under it, the player is shorter than a tile so it fits
+# lava and trophy cells are not places to stand, touching them ends the level
+def standable_cells(tilemap):
+    physics_tiles = tilemap.physics_tiles
+    return {(loc[0], loc[1] - 1) for loc, physics_tile in physics_tiles.items() if physics_tile[0] == PHYSICS_SOLID and (loc[0], loc[1] - 1) not in physics_tiles}
+
+
+# identifies the map as navigation sees it, anything besides the physics tiles can change without a rebuild
+def navigation_key(tilemap, collision_mode=COLLISION_NEARBY):
+    physics = sorted((loc[0], loc[1], physics_tile[0]) for loc, physics_tile in tilemap.physics_tiles.items())
+    data = json.dumps([NAVIGATION_VERSION, collision_mode, tilemap.tile_size, PLAYER_START, physics])
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class NavigationIndex:
+    def __init__(self, tile_size, nodes, edges, start, key=None):
+        self.tile_size = tile_size
+        self.nodes = nodes
+        self.start = start
+        self.key = key
+
+        # the tilemap version this index was built or checked for
+        self.version = None
+
+        # node -> edges leaving it, and node -> edges arriving at it
+        self.edges = {node: [] for node in nodes}
+        self.incoming = {node: [] for node in nodes}
+        self.incoming[TROPHY] = []
+        for edge in edges:
+            self.edges[edge.source].append(edge)
+            self.incoming[edge.target].append(edge)
+
+        # answers that only depend on the graph, worked out the first time they are asked for
+        self.reachable_from = {}
+        self.goal_distances = {}
+
+    # the node a player standing or landing at pos is in, None in mid air
+    def node_at(self, pos):
+        size = self.tile_size
+        y = int((pos[1] + PLAYER_SIZE[1]) // size) - 1
+        for x in (pos[0] + PLAYER_SIZE[0] / 2, pos[0], pos[0] + PLAYER_SIZE[0] - 1):
+            node = (int(x // size), y)
+            if node in self.nodes:
+                return node
+        return None
+
+    # every node, plus TROPHY, that can be got to from a node, by default from where the level starts
+    def reachable(self, start=None):
+        start = start or self.start
+        if start not in self.reachable_from:
+            found = set()
+            if start is not None:
+                found.add(start)
+                stack = [start]
+                while stack:
+                    node = stack.pop()
+                    for edge in self.edges.get(node, ()):
+                        if edge.target not in found:
+                            found.add(edge.target)
+                            if edge.target != TROPHY:
+                                stack.append(edge.target)
+            self.reachable_from[start] = found
+        return self.reachable_from[start]
+
+    # nodes the player can never stand on when starting from the start of the level
+    def unreachable(self):
+        return self.nodes - self.reachable()
+
+    def completable(self):
+        return TROPHY in self.reachable()
+
+    # frames from every node to goal, one backwards Dijkstra per goal answers all paths to it
+    def distances_to(self, goal=TROPHY):
+        if goal not in self.goal_distances:
+            distances = {goal: 0}
+            queue = [(0, 0, goal)]
+            order = 1
+            while queue:
+                distance, _, node = heapq.heappop(queue)
+                if distance > distances[node]:
+                    continue
+                for edge in self.incoming.get(node, ()):
+                    total = distance + edge.cost()
+                    if total < distances.get(edge.source, total + 1):
+                        distances[edge.source] = total
+                        heapq.heappush(queue, (total, order, edge.source))
+                        order += 1
+            self.goal_distances[goal] = distances
+        return self.goal_distances[goal]
+
+    # the first edge of the quickest way from node to goal, None if there is none
+    def next_edge(self, node, goal=TROPHY):
+        distances = self.distances_to(goal)
+        best = None
+        for edge in self.edges.get(node, ()):
+            if edge.target in distances and (best is None or edge.cost() + distances[edge.target] < best.cost() + distances[best.target]):
+                best = edge
+        return best
+
+    # the edges of the quickest way from start to goal, None if goal cannot be reached
+    def path(self, start=None, goal=TROPHY):
+        node = start or self.start
+        if node not in self.distances_to(goal):
+            return None
+        edges = []
+        while node != goal:
+            edge = self.next_edge(node, goal)
+            edges.append(edge)
+            node = edge.target
+        return edges
+
+    def to_json(self):
+        edges = []
+        for node_edges in self.edges.values():
+            for edge in node_edges:
+                runs = []
+                for mask in edge.masks:
+                    if runs and runs[-1][0] == mask:
+                        runs[-1][1] += 1
+                    else:
+                        runs.append([mask, 1])
+                edges.append([list(edge.source), list(edge.target) if edge.target != TROPHY else TROPHY, edge.start_x, runs])
+        return {'key': self.key, 'tile_size': self.tile_size, 'start': list(self.start) if self.start else None, 'nodes': sorted(list(node) for node in self.nodes), 'edges': edges}
+
+    @staticmethod
+    def from_json(data):
+        edges = []
+        for source, target, start_x, runs in data['edges']:
+            masks = []
+            for mask, count in runs:
+                masks.extend([mask] * count)
+            edges.append(NavigationEdge(tuple(source), tuple(target) if target != TROPHY else TROPHY, start_x, masks))
+        start = tuple(data['start']) if data['start'] else None
+        return NavigationIndex(data['tile_size'], {tuple(node) for node in data['nodes']}, edges, start, key=data['key'])
+
+
+# play one pattern from a standing position, returns the masks played and where they ended:
+# a node, TROPHY, or None if the player died, never landed or landed where it started
+def run_probe(tilemap, index, node, start_x, direction, pattern, collision_mode=COLLISION_NEARBY):
+    start_y = (node[1] + 1) * tilemap.tile_size - PLAYER_SIZE[1]
+    probe = NavigationProbe((start_x, start_y), collision_mode)
+    move = INPUT_RIGHT if direction > 0 else INPUT_LEFT
+    kind = pattern[0]
+    masks = []
+
+    # off the height it started at, from a jump or from walking off a ledge
+    left_ground = kind == 'jump'
+    jumped = False
+    for frame in range(MAX_PROBE_FRAMES):
+        if kind == 'jump':
+            mask = (INPUT_JUMP if frame == 0 else 0) | (move if pattern[1] <= frame < pattern[1] + pattern[2] else 0)
+        elif kind == 'walk_off' and left_ground:
+            mask = 0
+            if pattern[1]:
+                mask = move
+                if not jumped:
+                    mask |= INPUT_JUMP
+                    jumped = True
+        else:
+            mask = move
+        probe.step(tilemap, mask)
+        masks.append(mask)
+
+        # Player.update checks for death before the trophy, and the end screen for death wins
+        if probe.death_collisions or probe.pos[1] > FALL_DEATH_Y:
+            return masks, None
+        if probe.win_collision:
+            return masks, TROPHY
+
+        if probe.pos[1] > start_y + 1:
+            left_ground = True
+        if probe.collisions['down']:
+            landed = index.node_at(probe.pos)
+            if landed != node and (landed or left_ground):
+                return masks, landed
+            if left_ground:
+                return masks, None
+    return masks, None
+
+
+# where a player dropped at pos comes to stand
+def landing_node(tilemap, index, pos, collision_mode=COLLISION_NEARBY):
+    probe = NavigationProbe(pos, collision_mode)
+    for frame in range(MAX_PROBE_FRAMES):
+        probe.step(tilemap, 0)
+        if probe.death_collisions or probe.pos[1] > FALL_DEATH_Y:
+            return None
+        if probe.collisions['down']:
+            return index.node_at(probe.pos)
+    return None
+
+
+def build_navigation(tilemap, collision_mode=COLLISION_NEARBY, key=None):
+    size = tilemap.tile_size
+    nodes = standable_cells(tilemap)
+    index = NavigationIndex(size, nodes, [], None)
+
+    edges = []
+    for node in nodes:
+        # the quickest edge to each target, walks start in the middle of the cell and jumps from its front edge
+        best = {}
+        for direction in (-1, 1):
+            for pattern in PATTERNS:
+                if pattern[0] == 'jump':
+                    start_x = node[0] * size + (size - PLAYER_SIZE[0] if direction > 0 else 0)
+                else:
+                    start_x = node[0] * size + (size - PLAYER_SIZE[0]) // 2
+                masks, target = run_probe(tilemap, index, node, start_x, direction, pattern, collision_mode)
+                if target and (target not in best or len(masks) < best[target].cost()):
+                    best[target] = NavigationEdge(node, target, start_x, masks)
+        edges.extend(best.values())
+
+    return NavigationIndex(size, nodes, edges, landing_node(tilemap, index, PLAYER_START, collision_mode), key=key)
+
+
+def load_navigation(path):
+    f = open(path, 'r')
+    data = json.load(f)
+    f.close()
+    return NavigationIndex.from_json(data)
+
+
+def save_navigation(index, path):
+    f = open(path, 'w')
+    json.dump(index.to_json(), f)
+    f.close()
+
+
+# the navigation index of a tilemap, rebuilt only after an edit actually changed the physics tiles
+# with a map path the index is also read from and written to the map path plus NAVIGATION_SUFFIX
+def navigation_index(tilemap, map_path=None, collision_mode=COLLISION_NEARBY):
+    index = tilemap.navigation
+    if index and index.version == tilemap.version:
+        return index
+
+    key = navigation_key(tilemap, collision_mode)
+    if not (index and index.key == key):
+        index = None
+        cache_path = map_path + NAVIGATION_SUFFIX if map_path else None
+        if cache_path and os.path.exists(cache_path):
+            cached = load_navigation(cache_path)
+            if cached.key == key:
+                index = cached
+        if not index:
+            index = build_navigation(tilemap, collision_mode, key=key)
+            if cache_path:
+                save_navigation(index, cache_path)
+
+    index.version = tilemap.version
+    tilemap.navigation = index
+    return index
+
+
+# Builds navigation indexes on a background thread from snapshots of a tilemap, so the map can be edited meanwhile.
+# A new build only starts once the last one is done and the physics tiles changed since it was started.
+class NavigationBuilder:
+    def __init__(self, map_path=None, collision_mode=COLLISION_NEARBY):
+        self.map_path = map_path
+        self.collision_mode = collision_mode
+        self.thread = None
+        self.index = None
+        self.error = None
+
+        # the physics_version of the tilemap the last build was started from
+        self.physics_version = None
+
+    # call every frame, returns the newest finished index, which may be from before the latest edits, or None before the first
+    def update(self, tilemap):
+        if self.thread and not self.thread.is_alive():
+            self.thread.join()
+            self.thread = None
+            if self.error:
+                error = self.error
+                self.error = None
+                raise error
+        if not self.thread and tilemap.physics_version != self.physics_version:
+            self.physics_version = tilemap.physics_version
+            self.thread = threading.Thread(target=self.build, args=(tilemap.snapshot(),), daemon=True)
+            self.thread.start()
+        return self.index
+
+    # the snapshot's containers are never edited, the first edit of the tilemap copies them
+    def build(self, snapshot):
+        try:
+            tilemap = Tilemap(None, snapshot.tile_size)
+            tilemap.restore(snapshot, force=True)
+            self.index = navigation_index(tilemap, self.map_path, self.collision_mode)
+        except Exception as error:
+            self.error = error
+
+
+# follows the quickest path to the trophy one input mask at a time, for headless bots
+class NavigationBot:
+    def __init__(self, index, goal=TROPHY):
+        self.index = index
+        self.goal = goal
+        self.masks = []
+
+    def next_mask(self, player):
+        if self.masks:
+            return self.masks.pop()
+
+        node = self.index.node_at(player.pos)
+        edge = self.index.next_edge(node, self.goal) if node else None
+        if not edge:
+            return 0
+        if player.pos[0] != edge.start_x:
+            return INPUT_RIGHT if player.pos[0] < edge.start_x else INPUT_LEFT
+
+        # an edge starts on a frame the player touched the ground, the state its probe started in
+        if not player.collisions['down']:
+            return 0
+        self.masks = edge.masks[::-1]
+        return self.masks.pop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python -m scripts.navigation MAP')
+        sys.exit(1)
+    from scripts.simulation import HeadlessGame
+
+    game = HeadlessGame(sys.argv[1])
+    index = navigation_index(game.tilemap, sys.argv[1])
+    path = index.path()
+    print(json.dumps({
+        'nodes': len(index.nodes),
+        'edges': sum(len(edges) for edges in index.edges.values()),
+        'start': index.start,
+        'reachable': len(index.reachable() - {TROPHY}),
+        'unreachable': sorted(index.unreachable()),
+        'completable': index.completable(),
+        'frames_to_trophy': sum(edge.cost() for edge in path) if path else None,
+    }))
@@ -0,0 +1,161 @@
+# Playthrough Runner File
+#
+# Plays every map in a directory with a set of input traces and built-in policies, spread over
+# all cores with a process pool, and reports how hard each level is.
+#
+#     python -m scripts.playthroughs levels/ --traces traces/ --policies run_right,run_right_jump
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.simulation import HeadlessGame, load_trace, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, STEPS_PER_SECOND
+from scripts.mapformat import BINARY_MAP_EXTENSION
+from scripts.navigation import NavigationBot, navigation_index
+
+DEFAULT_MAX_STEPS = 60 * STEPS_PER_SECOND
+
+
+# policies pick the input mask of the next step from the current game state
+def run_right(game, step):
+    return INPUT_RIGHT
+
+
+def run_right_jump(game, step):
+    return INPUT_RIGHT | (INPUT_JUMP if game.player.can_jump else 0)
+
+
+def random_walk(game, step):
+    # seeded from the step so every run of the policy makes the same choices
+    rng = random.Random(step // 20)
+    return rng.choice([INPUT_RIGHT, INPUT_RIGHT, INPUT_LEFT, 0]) | (INPUT_JUMP if rng.random() < 0.3 else 0)
+
+
+# follows the quickest path the navigation index knows to the trophy
+def navigate(game, step):
+    if step == 0:
+        game.navigator = NavigationBot(navigation_index(game.tilemap))
+    return game.navigator.next_mask(game.player)
+
+
+POLICIES = {
+    'run_right': run_right,
+    'run_right_jump': run_right_jump,
+    'random_walk': random_walk,
+    'navigate': navigate,
+}
+
+
+def policy_inputs(game, policy, max_steps):
+    for step in range(max_steps):
+        yield policy(game, step)
+
+
+# worker processes keep their loaded maps so each one pays for the assets only once
+_games = {}
+
+
+def play(job):
+    map_path, label, trace_path, max_steps = job
+    if map_path not in _games:
+        _games[map_path] = HeadlessGame(map_path)
+    game = _games[map_path]
+    game.reset()
+
+    if trace_path:
+        inputs = load_trace(trace_path)
+    else:
+        inputs = policy_inputs(game, POLICIES[label], max_steps)
+    result = game.run(inputs, max_steps=max_steps)
+
+    result['map'] = map_path
+    result['input'] = label
+    result['tile'] = [int(result['pos'][0] // game.tilemap.tile_size), int(result['pos'][1] // game.tilemap.tile_size)]
+    return result
+
+
+# completion rate, time to trophy and where players died, per map
+def summarize(results):
+    maps = {}
+    for result in results:
+        maps.setdefault(result['map'], []).append(result)
+
+    summary = {}
+    for map_path, runs in sorted(maps.items()):
+        wins = [run for run in runs if run['outcome'] == 'won']
+        deaths = {}
+        for run in runs:
+            if run['outcome'] == 'dead':
+                loc = str(run['tile'][0]) + ';' + str(run['tile'][1])
+                deaths[loc] = deaths.get(loc, 0) + 1
+
+        summary[map_path] = {
+            'runs': len(runs),
+            'completion_rate': len(wins) / len(runs),
+            'died': sum(deaths.values()),
+            'timed_out': len(runs) - len(wins) - sum(deaths.values()),
+            'time_to_trophy': {
+                'min': min([run['time'] for run in wins], default=None),
+                'median': statistics.median([run['time'] for run in wins]) if wins else None,
+            },
+            'completed_by': sorted({run['input'] for run in wins}),
+            'death_locations': dict(sorted(deaths.items(), key=lambda item: -item[1])),
+        }
+    return summary
+
+
+# extensions may be one string or a tuple of them, like str.endswith takes
+def find_files(path, extensions):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(extensions))
+    return [path]
+
+
+def run_playthroughs(maps, traces=(), policies=(), max_steps=DEFAULT_MAX_STEPS, workers=None):
+    jobs = []
+    for map_path in maps:
+        for trace_path in traces:
+            jobs.append((map_path, os.path.basename(trace_path), trace_path, max_steps))
+        for name in policies:
+            jobs.append((map_path, name, None, max_steps))
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(play, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play many levels headless in parallel.')
+    parser.add_argument('maps', help='a .json or ' + BINARY_MAP_EXTENSION + ' map file or a directory of them')
+    parser.add_argument('--traces', help='an input trace file or a directory of them')
+    parser.add_argument('--policies', default='', help='comma separated names from: ' + ', '.join(POLICIES))
+    parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='also write the summary and every run to this json file')
+    args = parser.parse_args(argv)
+
+    maps = find_files(args.maps, ('.json', BINARY_MAP_EXTENSION))
+    traces = find_files(args.traces, '.json') if args.traces else []
+    policies = [name for name in args.policies.split(',') if name]
+    for name in policies:
+        if name not in POLICIES:
+            parser.error('unknown policy ' + name)
+    if not traces and not policies:
+        parser.error('give at least one trace or policy')
+
+    results = run_playthroughs(maps, traces, policies, args.max_steps, args.workers)
+    summary = summarize(results)
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        f = open(args.output, 'w')
+        json.dump({'summary': summary, 'runs': results}, f)
+        f.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,56 @@
+# Presentation File
+#
+# Owns the window and the low resolution surface the game draws into, and gets that surface onto
+# the window every frame without allocating a new scaled copy of it.
+#
+# scale modes:
+#     'stretch'  fill the whole window, like the game always did (default)
+#     'integer'  the largest whole number scale that fits, centred with black borders
+#     'sdl'      let SDL scale the window itself with pygame.SCALED, no scaling on our side
+
+import pygame
+
+SCALE_MODES = ('stretch', 'integer', 'sdl')
+
+
+class Presenter:
+    def __init__(self, render_size, window_size=None, scale=None, scale_mode='stretch'):
+        if scale_mode not in SCALE_MODES:
+            raise ValueError('scale_mode must be one of ' + ', '.join(SCALE_MODES))
+        if window_size is None:
+            window_size = (int(render_size[0] * (scale or 1)), int(render_size[1] * (scale or 1)))
+
+        self.render_size = render_size
+        self.scale_mode = scale_mode
+
+        if scale_mode == 'sdl':
+            # the window surface is the render surface, SDL scales it on the way to the screen
+            self.screen = pygame.display.set_mode(render_size, pygame.SCALED)
+            self.display = self.screen
+            self.target = None
+            self.target_rect = pygame.Rect(0, 0, render_size[0], render_size[1])
+            return
+
+        self.screen = pygame.display.set_mode(window_size)
+        self.display = pygame.Surface(render_size)
+
+        if scale_mode == 'integer':
+            factor = max(1, min(window_size[0] // render_size[0], window_size[1] // render_size[1]))
+            size = (render_size[0] * factor, render_size[1] * factor)
+            self.target_rect = pygame.Rect((window_size[0] - size[0]) // 2, (window_size[1] - size[1]) // 2, size[0], size[1])
+        else:
+            self.target_rect = self.screen.get_rect()
+
+        # the part of the window the display is scaled into, scaling writes straight into it
+        self.target = self.screen.subsurface(self.target_rect)
+
+    # scale the display onto the window and flip it
+    def present(self):
+        if self.target:
+            pygame.transform.scale(self.display, self.target_rect.size, self.target)
+        pygame.display.update()
+
+    # a window position such as the mouse in display coordinates
+    def to_display(self, pos):
+        return ((pos[0] - self.target_rect.x) * self.render_size[0] / self.target_rect.width,
+                (pos[1] - self.target_rect.y) * self.render_size[1] / self.target_rect.height)
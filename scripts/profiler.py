@@ -0,0 +1,90 @@
+# Frame Profiler File
+#
+# Times named sections of every frame, keeps the last few hundred frames to report rolling
+# p50/p95/p99 per section, can draw them on screen and can write every frame to a JSON lines
+# trace file for offline analysis.
+
+import json
+import time
+from collections import deque
+
+import pygame
+
+
+class FrameProfiler:
+    def __init__(self, window=300, trace_path=None):
+        self.window = window
+        self.samples = {}
+        self.frame_times = {}
+        self.frame = 0
+        self.frame_start = None
+        self.section_name = None
+        self.section_start = None
+
+        self.show_overlay = False
+        self.font = None
+
+        self.trace = open(trace_path, 'w') if trace_path else None
+
+    def start_frame(self):
+        self.frame_times = {}
+        self.frame_start = time.perf_counter()
+
+    # everything until the next section or end_frame call is timed under this name
+    def section(self, name):
+        now = time.perf_counter()
+        self.stop_section(now)
+        self.section_name = name
+        self.section_start = now
+
+    def stop_section(self, now):
+        if self.section_name:
+            self.frame_times[self.section_name] = self.frame_times.get(self.section_name, 0.0) + (now - self.section_start)
+            self.section_name = None
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.stop_section(now)
+        self.frame_times['frame'] = now - self.frame_start
+
+        for name, seconds in self.frame_times.items():
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+            self.samples[name].append(seconds)
+
+        if self.trace:
+            record = {name: round(seconds * 1000, 4) for name, seconds in self.frame_times.items()}
+            record['index'] = self.frame
+            self.trace.write(json.dumps(record) + '\n')
+        self.frame += 1
+
+    # p50, p95 and p99 of a section over the rolling window, in milliseconds
+    def percentiles(self, name):
+        ordered = sorted(self.samples.get(name, ()))
+        if not ordered:
+            return (0.0, 0.0, 0.0)
+        return tuple(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 for p in (0.5, 0.95, 0.99))
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+
+    def render(self, surf):
+        if not self.show_overlay:
+            return
+        if not self.font:
+            pygame.font.init()
+            self.font = pygame.font.SysFont(None, 14)
+
+        # the whole frame first, then the sections in the order they ran
+        names = ['frame'] + [name for name in self.samples if name != 'frame']
+        y = 2
+        for name in names:
+            p50, p95, p99 = self.percentiles(name)
+            text = self.font.render(f"{name:<8} {p50:6.2f} {p95:6.2f} {p99:6.2f} ms", True, (255, 255, 255), (0, 0, 0))
+            surf.blit(text, (2, y))
+            y += text.get_height()
+
+    def close(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,127 @@
+# Replay File
+#
+# Records the input of every frame the game plays to a small binary file and feeds it back in
+# later, so a run can be reproduced exactly. Playback can fast forward without drawing and seek to
+# any frame by restoring the nearest earlier state snapshot and simulating forward from there.
+#
+#     python main.py --record run.nrpl
+#     python main.py --replay run.nrpl [--seek FRAME]
+#
+# Layout, all little endian:
+#     header   magic 'NRPL', version (u16), steps per second (u16), map path length (u16) + utf-8 map path
+#     runs     per run of identical frames: input mask (u8), frame count (u16)
+#
+# Runs are written out at least once a second of play, so a game that crashes loses at most the
+# last second of its recording. A run cut off halfway through by a crash is skipped when loading.
+
+import struct
+
+from scripts.simulation import STEPS_PER_SECOND, INPUT_RESET
+
+REPLAY_EXTENSION = '.nrpl'
+
+MAGIC = b'NRPL'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHH')
+RUN = struct.Struct('<BH')
+# the longest a run is held in memory before it is written, in frames, well within the u16 count
+FLUSH_RUN = STEPS_PER_SECOND
+
+
+class ReplayRecorder:
+    def __init__(self, path, map_path):
+        self.f = open(path, 'wb')
+        map_bytes = map_path.encode()
+        self.f.write(HEADER.pack(MAGIC, VERSION, STEPS_PER_SECOND, len(map_bytes)) + map_bytes)
+        self.mask = None
+        self.count = 0
+
+    # the input mask of one frame, runs are written once the input changes or a second has gone by
+    def record(self, mask):
+        if mask == self.mask and self.count < FLUSH_RUN:
+            self.count += 1
+            return
+        self.write_run()
+        self.f.flush()
+        self.mask = mask
+        self.count = 1
+
+    def write_run(self):
+        if self.count:
+            self.f.write(RUN.pack(self.mask, self.count))
+            self.count = 0
+
+    def close(self):
+        if self.f:
+            self.write_run()
+            self.f.close()
+            self.f = None
+
+
+# the map a replay was recorded on and the input mask of every frame
+def load_replay(path):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+
+    magic, version, steps_per_second, map_length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(path + ' is not a version ' + str(VERSION) + ' replay')
+    if steps_per_second != STEPS_PER_SECOND:
+        raise ValueError(path + ' was recorded at ' + str(steps_per_second) + ' steps per second')
+    offset = HEADER.size
+    map_path = data[offset:offset + map_length].decode()
+    offset += map_length
+
+    # a partial run at the end is from a recording that was cut off
+    runs = data[offset:]
+    inputs = []
+    for mask, count in RUN.iter_unpack(runs[:len(runs) - len(runs) % RUN.size]):
+        inputs.extend([mask] * count)
+    return map_path, inputs
+
+
+# Plays recorded inputs into a game, which needs step(mask), snapshot_state() and restore_state(state)
+class ReplayPlayer:
+    def __init__(self, game, inputs, snapshot_interval=STEPS_PER_SECOND * 5):
+        self.game = game
+        self.inputs = inputs
+        self.frame = 0
+        self.snapshot_interval = snapshot_interval
+
+        # frame -> game state before that frame's input was applied
+        self.snapshots = {}
+
+    def finished(self):
+        return self.frame >= len(self.inputs)
+
+    # the level ended and the recording does not restart it, the end screen is where it stops
+    def stalled(self):
+        if not (self.game.game_over or self.game.game_winner):
+            return False
+        return self.finished() or not self.inputs[self.frame] & INPUT_RESET
+
+    # the input mask for the next frame, snapshotting the state every snapshot_interval frames on the way
+    def next_mask(self):
+        if self.frame % self.snapshot_interval == 0 and self.frame not in self.snapshots:
+            self.snapshots[self.frame] = self.game.snapshot_state()
+        mask = self.inputs[self.frame]
+        self.frame += 1
+        return mask
+
+    # simulate frames without drawing them
+    def fast_forward(self, frames):
+        for _ in range(frames):
+            if self.finished() or self.stalled():
+                return
+            self.game.step(self.next_mask())
+
+    # jump to any frame, going back restores the nearest snapshot before it and simulates the rest
+    def seek(self, frame):
+        frame = max(0, min(frame, len(self.inputs)))
+        if frame < self.frame:
+            start = max(snapshot_frame for snapshot_frame in self.snapshots if snapshot_frame <= frame)
+            self.game.restore_state(self.snapshots[start])
+            self.frame = start
+        self.fast_forward(frame - self.frame)
@@ -0,0 +1,141 @@
+# Headless Simulation File
+#
+# Steps the player against a tilemap without a window, as fast as the CPU allows.
+# Every step is one frame of the real game, driven by an input trace instead of the keyboard.
+#
+#     python -m scripts.simulation map.json trace.json
+#     python -m scripts.simulation map.json run.nrpl
+
+import json
+import os
+import sys
+import time
+
+import pygame
+
+from scripts.utilities import load_images, save_asset_cache, Animation
+from scripts.entities import Player, COLLISION_NEARBY
+from scripts.tilemaps import Tilemap
+
+# the frame rate Game.run ticks at, one simulation step is one of these frames
+STEPS_PER_SECOND = 110
+
+# bits of the per step input mask
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+# the level was restarted before this step, only recorded replays use it
+INPUT_RESET = 8
+
+PLAYER_START = (50, 50)
+PLAYER_SIZE = (8, 15)
+
+
+# turns the held keys of a step into an input mask
+def input_mask(left=False, right=False, jump=False):
+    return (INPUT_LEFT if left else 0) | (INPUT_RIGHT if right else 0) | (INPUT_JUMP if jump else 0)
+
+
+# traces are stored run length encoded as [[count, mask], ...]
+def save_trace(path, inputs):
+    runs = []
+    for mask in inputs:
+        if runs and runs[-1][1] == mask:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, mask])
+    f = open(path, 'w')
+    json.dump({'steps_per_second': STEPS_PER_SECOND, 'inputs': runs}, f)
+    f.close()
+
+
+def load_trace(path):
+    f = open(path, 'r')
+    trace_data = json.load(f)
+    f.close()
+
+    inputs = []
+    for count, mask in trace_data['inputs']:
+        inputs.extend([mask] * count)
+    return inputs
+
+
+# stands in for Game with only what Player and Tilemap need, no window and no scaling
+class HeadlessGame:
+    def __init__(self, map_path='map.json', collision_mode=COLLISION_NEARBY):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.display.init()
+        if not pygame.display.get_surface():
+            pygame.display.set_mode((1, 1))
+
+        self.assets = {
+            'player/idle': Animation(load_images("entities/player/idle"), img_dur=6),
+            'player/run': Animation(load_images("entities/player/run"), img_dur=4),
+            'player/jump': Animation(load_images("entities/player/jump")),
+            'player/winner': Animation(load_images("entities/player/winner")),
+            'player/death': Animation(load_images("entities/player/death")),
+        }
+        save_asset_cache()
+
+        self.tilemap = Tilemap(self, tile_size=16)
+        self.tilemap.load(map_path)
+        self.collision_mode = collision_mode
+        self.reset()
+
+    def reset(self):
+        self.player = Player(self, PLAYER_START, PLAYER_SIZE, collision_mode=self.collision_mode)
+        self.game_over = False
+        self.game_winner = False
+        self.steps = 0
+
+    # advance one frame the same way Game.run does, movement first and the jump key afterwards
+    def step(self, mask):
+        if mask & INPUT_RESET:
+            self.reset()
+        self.player.update(self.tilemap, (bool(mask & INPUT_RIGHT) - bool(mask & INPUT_LEFT), 0))
+        if mask & INPUT_JUMP:
+            self.player.jump()
+        self.steps += 1
+
+    # 'dead' or 'won' once the player has died or reached the trophy, otherwise None
+    def outcome(self):
+        if self.player.is_dead:
+            return 'dead'
+        if self.player.did_win:
+            return 'won'
+        return None
+
+    # play the inputs until they run out or the level ends and report what happened
+    def run(self, inputs, max_steps=None):
+        start = time.perf_counter()
+        for mask in inputs:
+            if self.outcome() or (max_steps is not None and self.steps >= max_steps):
+                break
+            self.step(mask)
+        elapsed = time.perf_counter() - start
+
+        return {
+            'outcome': self.outcome() or 'alive',
+            'steps': self.steps,
+            'time': self.steps / STEPS_PER_SECOND,
+            'pos': list(self.player.pos),
+            'steps_per_sec': self.steps / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def simulate(map_path, inputs, max_steps=None):
+    return HeadlessGame(map_path).run(inputs, max_steps=max_steps)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python -m scripts.simulation MAP TRACE')
+        sys.exit(1)
+    from scripts.replay import REPLAY_EXTENSION, load_replay
+
+    if sys.argv[2].endswith(REPLAY_EXTENSION):
+        inputs = load_replay(sys.argv[2])[1]
+    else:
+        inputs = load_trace(sys.argv[2])
+    result = simulate(sys.argv[1], inputs)
+    print(json.dumps(result))
@@ -0,0 +1,144 @@
+# Streaming Tilemap File
+#
+# For worlds too large to keep in memory. Only the chunks of a binary .nmap map around the camera
+# are resident: chunks on screen are loaded right away, chunks further out and ahead of the camera
+# are read on a background thread, and once more than max_chunks are resident the least recently
+# seen ones are dropped. Offgrid decor is small and stays fully loaded.
+
+import queue
+import threading
+from collections import OrderedDict
+
+from scripts.mapformat import MapFile
+from scripts.tilemaps import Tilemap, Tile, CHUNK_SIZE
+
+
+class StreamingTilemap(Tilemap):
+    def __init__(self, game, path, radius=2, lookahead=2, max_chunks=None):
+        super().__init__(game)
+        self.map_file = MapFile(path)
+        if self.map_file.chunk_size != CHUNK_SIZE:
+            raise ValueError(path + ' was written with chunk size ' + str(self.map_file.chunk_size) + ', streaming needs ' + str(CHUNK_SIZE))
+
+        self.tile_size = self.map_file.tile_size
+        self.offgrid_tiles = [Tile(tile_type, variant, (x, y)) for x, y, tile_type, variant in self.map_file.offgrid()]
+        self.build_offgrid_index()
+        self.pristine = self.snapshot()
+
+        self.radius = radius
+        self.lookahead = lookahead
+        self.max_chunks = max_chunks or 2 * (2 * (radius + lookahead) + 1) ** 2
+
+        # resident chunk -> tile positions in it, least recently seen first
+        self.resident = OrderedDict()
+        self.requested = set()
+        self.last_center = None
+
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.loader = threading.Thread(target=self.load_chunks, daemon=True)
+        self.loader.start()
+
+    # background thread, decodes requested chunks until it gets None
+    def load_chunks(self):
+        while True:
+            chunk_loc = self.requests.get()
+            if chunk_loc is None:
+                return
+            self.results.put((chunk_loc, self.map_file.chunk_tiles(chunk_loc)))
+
+    def chunk_range(self, left, top, right, bottom):
+        return {(cx, cy) for cx in range(left, right + 1) for cy in range(top, bottom + 1)}
+
+    # call once per frame with the camera scroll and the size of the view it renders
+    def update_stream(self, scroll, view_size):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        left = int(scroll[0] // chunk_px)
+        top = int(scroll[1] // chunk_px)
+        right = int((scroll[0] + view_size[0]) // chunk_px)
+        bottom = int((scroll[1] + view_size[1]) // chunk_px)
+
+        # everything on screen plus one chunk so the player's collision neighbourhood is always there
+        visible = self.chunk_range(left - 1, top - 1, right + 1, bottom + 1)
+
+        # the rest of the radius, stretched towards the way the camera is moving
+        center = ((left + right) / 2, (top + bottom) / 2)
+        direction = (0, 0)
+        if self.last_center:
+            direction = ((center[0] > self.last_center[0]) - (center[0] < self.last_center[0]), (center[1] > self.last_center[1]) - (center[1] < self.last_center[1]))
+        self.last_center = center
+        wanted = self.chunk_range(
+            left - self.radius - self.lookahead * (direction[0] < 0),
+            top - self.radius - self.lookahead * (direction[1] < 0),
+            right + self.radius + self.lookahead * (direction[0] > 0),
+            bottom + self.radius + self.lookahead * (direction[1] > 0),
+        )
+
+        self.receive_chunks()
+        for chunk_loc in visible:
+            if chunk_loc not in self.resident:
+                self.insert_chunk(chunk_loc, self.map_file.chunk_tiles(chunk_loc))
+        for chunk_loc in wanted:
+            if chunk_loc not in self.resident and chunk_loc not in self.requested and chunk_loc in self.map_file.directory:
+                self.requested.add(chunk_loc)
+                self.requests.put(chunk_loc)
+
+        for chunk_loc in visible:
+            self.resident.move_to_end(chunk_loc)
+        self.evict(wanted)
+
+    # move chunks the loader has finished into the map
+    def receive_chunks(self):
+        while True:
+            try:
+                chunk_loc, tiles = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.requested.discard(chunk_loc)
+            if chunk_loc not in self.resident:
+                self.insert_chunk(chunk_loc, tiles)
+
+    def insert_chunk(self, chunk_loc, tiles):
+        self.unshare()
+        locs = []
+        for x, y, tile_type, variant in tiles:
+            loc = (x, y)
+            self.tilemap[loc] = Tile(tile_type, variant, loc)
+            self.update_physics(loc)
+            locs.append(loc)
+            if self.spill is not None:
+                self.spill = max(self.spill, self.image_spill(self.tile_image(self.tilemap[loc])))
+        self.resident[chunk_loc] = locs
+        self.invalidate_chunk(chunk_loc)
+
+    # drop the least recently seen chunks outside the wanted area until the budget fits again
+    def evict(self, wanted):
+        for chunk_loc in list(self.resident):
+            if len(self.resident) <= self.max_chunks:
+                return
+            if chunk_loc in wanted:
+                continue
+            self.unshare()
+            for loc in self.resident.pop(chunk_loc):
+                self.tilemap.pop(loc, None)
+                self.update_physics(loc)
+            self.invalidate_chunk(chunk_loc)
+
+    # tiles can hang over into the chunks to the right and below, so those are redrawn as well
+    def invalidate_chunk(self, chunk_loc):
+        for offset in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+            self.chunks.pop((chunk_loc[0] + offset[0], chunk_loc[1] + offset[1]), None)
+
+    # edits are undone by dropping every chunk, they stream back in from the file on the next frame
+    # so any snapshot restores to the file, and streaming chunks in and out is not an edit so a map that was only played restores instantly
+    def restore(self, snapshot=None, force=False):
+        if not super().restore(self.pristine, force or (snapshot is not None and snapshot.version != self.version)):
+            return False
+        self.resident.clear()
+        self.last_center = None
+        return True
+
+    def close(self):
+        self.requests.put(None)
+        self.loader.join()
+        self.map_file.close()
@@ -1,9 +1,13 @@
 # Tilemap file
 
+import itertools
 import json
+import math
 
 import pygame
 
+from scripts.mapformat import MapFile, is_binary_map, write_map
+
 #auto generate stone tiles based on the positions of the tile
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
@@ -23,94 +27,622 @@ NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1)
 PHYSICS_TILES = {'grass', 'stone', 'bridge', 'platforms', 'lava', 'trophy'}
 AUTOTILE_TYPES = {'stone'}
 
+# how a tile behaves for physics, tiles that are not in PHYSICS_TILES are empty
+PHYSICS_EMPTY = 0
+PHYSICS_SOLID = 1
+PHYSICS_LAVA = 2
+PHYSICS_TROPHY = 3
+
+
+def physics_kind(tile_type):
+    if tile_type == 'lava':
+        return PHYSICS_LAVA
+    if tile_type == 'trophy':
+        return PHYSICS_TROPHY
+    if tile_type in PHYSICS_TILES:
+        return PHYSICS_SOLID
+    return PHYSICS_EMPTY
+
+# number of tiles along each side of a pre-rendered chunk
+CHUNK_SIZE = 16
+
+# how many pre-rendered chunks are kept, the least recently seen are dropped past this, about 32MB at 16px tiles
+MAX_CHUNK_SURFACES = 128
+
+
+# a single tile, pos is in tiles for grid tiles and in pixels for offgrid tiles
+class Tile:
+    __slots__ = ('type', 'variant', 'pos')
+
+    def __init__(self, tile_type, variant, pos):
+        self.type = tile_type
+        self.variant = variant
+        self.pos = pos
+
+    # the dict stored in map.json
+    def to_json(self):
+        return {'type': self.type, 'variant': self.variant, 'pos': list(self.pos)}
+
+
+# the tile containers of a map at one moment, shared with the map until either side is edited
+class TilemapSnapshot:
+    __slots__ = ('version', 'tile_size', 'tilemap', 'offgrid_tiles', 'offgrid_chunks', 'physics_tiles', 'spill')
+
+    def __init__(self, tilemap):
+        self.version = tilemap.version
+        self.tile_size = tilemap.tile_size
+        self.tilemap = tilemap.tilemap
+        self.offgrid_tiles = tilemap.offgrid_tiles
+        self.offgrid_chunks = tilemap.offgrid_chunks
+        self.physics_tiles = tilemap.physics_tiles
+        self.spill = tilemap.spill
+
 
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
+
+        # grid tiles keyed by their (x, y) tile position
         self.tilemap = {}
         self.offgrid_tiles = []
+
+        # offgrid tiles bucketed by every chunk their image overlaps, in the same order as offgrid_tiles
+        self.offgrid_chunks = {}
+
+        # bumped by every edit, and a snapshot of the map as it was loaded so a level can be reset without the disk
+        self.version = 0
+        self.pristine = None
+
+        # while the containers are shared with a snapshot the first edit copies them
+        self.shared = False
+
+        # an EditJournal gets told about every edit while it is attached
+        self.journal = None
+
+        # the NavigationIndex of the map, checked against version before it is used again
+        self.navigation = None
+
+        # physics kind and collision rect of every non-empty physics tile, plus the answers of physics_rects_around per tile position
+        self.physics_tiles = {}
+        self.physics_queries = {}
+
+        # bumped only when the physics kind of some tile position changes, edits to decor or variants leave it alone
+        self.physics_version = 0
+
+        # pre-rendered chunk surfaces, None for chunks with nothing to draw, least recently seen first
+        self.chunks = {}
+        self.max_chunk_surfaces = MAX_CHUNK_SURFACES
+        self.chunk_images = {}
+        self.spill = None
     
     # looks at the current tile position and returns an array of surrounding tiles
     def tiles_around(self, pos):
         tiles = []
-        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = self.tilemap.get((tile_x + offset[0], tile_y + offset[1]))
+            if tile:
+                tiles.append(tile)
         return tiles
 
     
     
-    # saves the map created in the editor to json file
+    # saves the map created in the editor to json file, or to the binary format for .nmap paths
     def save(self, path):
+        if is_binary_map(path):
+            tiles = [(loc[0], loc[1], tile.type, tile.variant) for loc, tile in self.tilemap.items()]
+            offgrid = [(tile.pos[0], tile.pos[1], tile.type, tile.variant) for tile in self.offgrid_tiles]
+            write_map(path, self.tile_size, tiles, offgrid, chunk_size=CHUNK_SIZE)
+            return
+
+        tilemap = {str(loc[0]) + ';' + str(loc[1]): tile.to_json() for loc, tile in self.tilemap.items()}
+        offgrid = [tile.to_json() for tile in self.offgrid_tiles]
         f = open(path, 'w')
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f)
+        json.dump({'tilemap': tilemap, 'tile_size': self.tile_size, 'offgrid': offgrid}, f)
         f.close()
         
         
-    # load the map.json file         
+    # load the map.json file, or a binary .nmap map
     def load(self, path):
+        if is_binary_map(path):
+            map_file = MapFile(path)
+            tiles = []
+            for chunk_loc in map_file.chunks():
+                tiles.extend(map_file.chunk_tiles(chunk_loc))
+            offgrid = map_file.offgrid()
+            self.load_tiles(map_file.tile_size, [((x, y), tile_type, variant) for x, y, tile_type, variant in tiles], [((x, y), tile_type, variant) for x, y, tile_type, variant in offgrid])
+            map_file.close()
+            return
+
         f = open(path, 'r')
         map_data = json.load(f)
         f.close()
-        
-        self.tilemap = map_data['tilemap']
-        self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+
+        tiles = [(tuple(tile_data['pos']), tile_data['type'], tile_data.get('variant', 0)) for tile_data in map_data['tilemap'].values()]
+        offgrid = [(tuple(tile_data['pos']), tile_data['type'], tile_data.get('variant', 0)) for tile_data in map_data['offgrid']]
+        self.load_tiles(map_data['tile_size'], tiles, offgrid)
+
+    # replace the whole map with (pos, type, variant) tuples and remember them as the pristine level
+    def load_tiles(self, tile_size, tiles, offgrid):
+        self.tile_size = tile_size
+        self.tilemap = {}
+        for pos, tile_type, variant in tiles:
+            self.tilemap[pos] = Tile(tile_type, variant, pos)
+        self.offgrid_tiles = [Tile(tile_type, variant, pos) for pos, tile_type, variant in offgrid]
+        self.shared = False
+        self.build_offgrid_index()
+        self.version += 1
+        self.chunks = {}
+        self.spill = None
+        self.build_physics()
+        self.pristine = self.snapshot()
+
+    # capture the map without copying anything, the containers are copied by whichever edit comes first
+    def snapshot(self):
+        self.shared = True
+        return TilemapSnapshot(self)
+
+    # put the map back to a snapshot, by default the way it was loaded
+    # the snapshot's containers are taken over as they are, and nothing happens at all if the map has not changed since
+    # every edit and restore bumps the version, so a snapshot of the current version holds exactly what the map holds
+    # returns whether anything changed
+    def restore(self, snapshot=None, force=False):
+        snapshot = snapshot or self.pristine
+        if snapshot.version == self.version and not force:
+            return False
+        self.tile_size = snapshot.tile_size
+        self.tilemap = snapshot.tilemap
+        self.offgrid_tiles = snapshot.offgrid_tiles
+        self.offgrid_chunks = snapshot.offgrid_chunks
+        if self.physics_tiles is not snapshot.physics_tiles:
+            self.physics_version += 1
+        self.physics_tiles = snapshot.physics_tiles
+        self.spill = snapshot.spill
+        self.shared = True
+        self.version += 1
+        self.physics_queries = {}
+        self.chunks = {}
+        return True
+
+    # called before every edit, gives the map its own containers if a snapshot still shares them
+    def unshare(self):
+        if self.shared:
+            self.tilemap = dict(self.tilemap)
+            self.offgrid_tiles = list(self.offgrid_tiles)
+            self.offgrid_chunks = {chunk_loc: list(bucket) for chunk_loc, bucket in self.offgrid_chunks.items()}
+            self.physics_tiles = dict(self.physics_tiles)
+            self.shared = False
+
+    # classify every tile for collisions once so the per frame queries only look things up
+    def build_physics(self):
+        self.physics_tiles = {}
+        self.physics_queries = {}
+        self.physics_version += 1
+        for loc in self.tilemap:
+            self.classify_physics(loc)
+
+    def classify_physics(self, loc):
+        tile = self.tilemap.get(loc)
+        kind = physics_kind(tile.type) if tile else PHYSICS_EMPTY
+        old = self.physics_tiles.get(loc)
+        if (old[0] if old else PHYSICS_EMPTY) != kind:
+            self.physics_version += 1
+        if kind == PHYSICS_EMPTY:
+            self.physics_tiles.pop(loc, None)
+        else:
+            self.physics_tiles[loc] = (kind, pygame.Rect(loc[0] * self.tile_size, loc[1] * self.tile_size, self.tile_size, self.tile_size))
+
+    # refresh the physics of one tile position after it changed
+    def update_physics(self, loc):
+        self.classify_physics(loc)
+
+        # every cached query whose neighbourhood contains this tile is now stale
+        for offset in NEIGHBOR_OFFSETS:
+            self.physics_queries.pop((loc[0] - offset[0], loc[1] - offset[1]), None)
     
       
-    # create a rectangle around the tiles, trophy, and lava
+    # collision rects of the solid tiles around a position and whether lava or a trophy is touched
+    # the result is cached per tile position, so the returned rects must not be modified
     def physics_rects_around(self, pos):
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        query = self.physics_queries.get(tile_loc)
+        if query:
+            return query
+
         rects = []
         death = False 
         winner = False
         
-        for tile in self.tiles_around(pos):
-            tile_rect = pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size)
-            
-            if tile['type'] in PHYSICS_TILES and tile['type'] != 'lava' and tile['type'] != 'trophy':
+        for offset in NEIGHBOR_OFFSETS:
+            physics_tile = self.physics_tiles.get((tile_loc[0] + offset[0], tile_loc[1] + offset[1]))
+            if not physics_tile:
+                continue
+            kind, tile_rect = physics_tile
+
+            if kind == PHYSICS_SOLID:
                 rects.append(tile_rect)
                   
-            if tile['type'] == 'lava':
+            if kind == PHYSICS_LAVA:
                 death = True  
                    
-            if tile['type'] == 'trophy':
+            if kind == PHYSICS_TROPHY:
                 winner = True
-                
-        return rects, death, winner 
+
+        query = (rects, death, winner)
+        self.physics_queries[tile_loc] = query
+        return query
     
     
+    # the variant autotiling gives the tile at loc, None if its neighbours are not in AUTOTILE_MAP and it keeps its own
+    def autotile_variant(self, loc, tile):
+        neighbors = set()
+        for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
+            check_tile = self.tilemap.get((loc[0] + shift[0], loc[1] + shift[1]))
+            if check_tile and check_tile.type == tile.type:
+                neighbors.add(shift)
+        return AUTOTILE_MAP.get(tuple(sorted(neighbors)))
+
     # iterate over the tiles and see the neighboring tiles then see if there is a matching type to sort and convert the tiles
     def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
+        changed = {}
+        for loc, tile in self.tilemap.items():
+            if tile.type not in AUTOTILE_TYPES:
+                continue
+            variant = self.autotile_variant(loc, tile)
+            if variant is not None and variant != tile.variant:
+                if self.journal:
+                    self.journal.record_tile(loc, (tile.type, tile.variant), (tile.type, variant))
+                # tiles can be shared with snapshots, so a changed tile is replaced rather than changed in place
+                changed[loc] = Tile(tile.type, variant, loc)
+
+        # a map that is already autotiled is not an edit, and only the chunks of changed tiles are redrawn
+        if not changed:
+            return 0
+        dirty_chunks = set()
+        spill = 0
+        for loc, tile in changed.items():
+            dirty_chunks.update(self.tile_chunks(self.tilemap[loc]))
+            dirty_chunks.update(self.tile_chunks(tile))
+            spill = max(spill, self.image_spill(self.tile_image(tile)))
+        self.unshare()
+        self.tilemap.update(changed)
+        self.version += 1
+        for chunk_loc in dirty_chunks:
+            self.chunks.pop(chunk_loc, None)
+        if self.spill is not None:
+            self.spill = max(self.spill, spill)
+        return len(changed)
+
+    # autotile only a tile position and its four neighbours, after the tile there was placed or removed
+    # gives the same variants as a full autotile pass while only touching the tiles that can have changed
+    def autotile_around(self, tile_pos):
+        self.autotile_cells([tile_pos])
+
+    # autotile_around for many edited tile positions at once, applied as a single batch
+    def autotile_cells(self, tile_positions):
+        locs = set()
+        for tile_pos in tile_positions:
+            for shift in [(0, 0), (1, 0), (-1, 0), (0, -1), (0, 1)]:
+                locs.add((tile_pos[0] + shift[0], tile_pos[1] + shift[1]))
+
+        # variants are all worked out before any is changed, like the full pass does
+        changes = []
+        for loc in locs:
+            tile = self.tilemap.get(loc)
+            if not tile or tile.type not in AUTOTILE_TYPES:
+                continue
+            variant = self.autotile_variant(loc, tile)
+            if variant is not None:
+                changes.append((loc, tile.type, variant))
+        self.set_tiles(changes)
+
+    # place a tile on the grid, replacing whatever was there before
+    def set_tile(self, tile_pos, tile_type, variant):
+        loc = (tile_pos[0], tile_pos[1])
+        old_tile = self.tilemap.get(loc)
+        if old_tile:
+            if old_tile.type == tile_type and old_tile.variant == variant:
+                return
+            self.invalidate_tile(old_tile)
+        self.unshare()
+        if self.journal:
+            self.journal.record_tile(loc, (old_tile.type, old_tile.variant) if old_tile else None, (tile_type, variant))
+        tile = Tile(tile_type, variant, loc)
+        self.tilemap[loc] = tile
+        self.version += 1
+        self.invalidate_tile(tile)
+        self.update_physics(loc)
+        if self.spill is not None:
+            self.spill = max(self.spill, self.image_spill(self.tile_image(tile)))
+
+    # apply many grid edits at once, changes are (tile_pos, type, variant) and a type of None removes the tile
+    # the render and collision caches are invalidated once for the whole batch instead of once per tile
+    def set_tiles(self, changes):
+        self.unshare()
+        dirty_chunks = set()
+        dirty_locs = []
+        spill = 0
+        for tile_pos, tile_type, variant in changes:
+            loc = (tile_pos[0], tile_pos[1])
+            old_tile = self.tilemap.get(loc)
+            if tile_type is None:
+                if not old_tile:
+                    continue
+            elif old_tile and old_tile.type == tile_type and old_tile.variant == variant:
+                continue
+
+            if self.journal:
+                self.journal.record_tile(loc, (old_tile.type, old_tile.variant) if old_tile else None, (tile_type, variant) if tile_type else None)
+            if old_tile:
+                dirty_chunks.update(self.tile_chunks(old_tile))
+            if tile_type is None:
+                del self.tilemap[loc]
+            else:
+                tile = Tile(tile_type, variant, loc)
+                self.tilemap[loc] = tile
+                dirty_chunks.update(self.tile_chunks(tile))
+                spill = max(spill, self.image_spill(self.tile_image(tile)))
+            dirty_locs.append(loc)
+
+        if not dirty_locs:
+            return 0
+        self.version += 1
+        for chunk_loc in dirty_chunks:
+            self.chunks.pop(chunk_loc, None)
+        if self.spill is not None:
+            self.spill = max(self.spill, spill)
+        for loc in dirty_locs:
+            self.classify_physics(loc)
+        self.physics_queries = {}
+        return len(dirty_locs)
+
+    # the 4-connected tile positions around start that have the same type as start, at most limit of them
+    # an empty start fills empty cells, kept inside the bounds of the map so the fill cannot run off forever
+    def flood_region(self, start, limit=100000):
+        start = (start[0], start[1])
+        start_tile = self.tilemap.get(start)
+        start_type = start_tile.type if start_tile else None
+        if start_type is None:
+            if not self.tilemap:
+                return []
+            bounds = (min(loc[0] for loc in self.tilemap), min(loc[1] for loc in self.tilemap), max(loc[0] for loc in self.tilemap), max(loc[1] for loc in self.tilemap))
+            if not (bounds[0] <= start[0] <= bounds[2] and bounds[1] <= start[1] <= bounds[3]):
+                return []
+
+        region = [start]
+        seen = {start}
+        stack = [start]
+        while stack and len(region) < limit:
+            loc = stack.pop()
             for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
-                
-    
-    # Render the offgrid and ongrid tiles
-    def render(self, surf, offset=(0, 0)):
+                check_loc = (loc[0] + shift[0], loc[1] + shift[1])
+                if check_loc in seen:
+                    continue
+                check_tile = self.tilemap.get(check_loc)
+                if (check_tile.type if check_tile else None) != start_type:
+                    continue
+                if start_type is None and not (bounds[0] <= check_loc[0] <= bounds[2] and bounds[1] <= check_loc[1] <= bounds[3]):
+                    continue
+                seen.add(check_loc)
+                region.append(check_loc)
+                stack.append(check_loc)
+                if len(region) >= limit:
+                    break
+        return region
+
+    # remove the tile on the grid at the given tile position
+    def remove_tile(self, tile_pos):
+        loc = (tile_pos[0], tile_pos[1])
+        if loc in self.tilemap:
+            self.unshare()
+            if self.journal:
+                self.journal.record_tile(loc, (self.tilemap[loc].type, self.tilemap[loc].variant), None)
+            self.version += 1
+            self.invalidate_tile(self.tilemap.pop(loc))
+            self.update_physics(loc)
+
+    # place a decoration at any pixel position, on top of the others or at a position in the draw order
+    def add_offgrid(self, tile_type, variant, pos, index=None):
+        tile = Tile(tile_type, variant, (pos[0], pos[1]))
+        self.unshare()
+        if index is None or index >= len(self.offgrid_tiles):
+            index = len(self.offgrid_tiles)
+            self.offgrid_tiles.append(tile)
+            self.index_offgrid(tile)
+        else:
+            self.offgrid_tiles.insert(index, tile)
+            self.index_offgrid(tile)
+            # keep the buckets in draw order
+            order = {id(other): i for i, other in enumerate(self.offgrid_tiles)}
+            for chunk_loc in self.offgrid_tile_chunks(tile):
+                self.offgrid_chunks[chunk_loc].sort(key=lambda other: order[id(other)])
+        if self.journal:
+            self.journal.record_offgrid(index, tile, True)
+        self.version += 1
+        self.invalidate_tile(tile, ongrid=False)
+        return tile
+
+    # add (pos, type, variant) decorations on top of the others as one edit, like set_tiles does for grid tiles
+    # the chunks they touch are dropped once at the end, returns how many were added
+    def add_offgrid_tiles(self, changes):
+        if not changes:
+            return 0
+        self.unshare()
+        dirty_chunks = set()
+        for pos, tile_type, variant in changes:
+            tile = Tile(tile_type, variant, (pos[0], pos[1]))
+            if self.journal:
+                self.journal.record_offgrid(len(self.offgrid_tiles), tile, True)
+            self.offgrid_tiles.append(tile)
+            self.index_offgrid(tile)
+            dirty_chunks.update(self.tile_chunks(tile, ongrid=False))
+        self.version += 1
+        for chunk_loc in dirty_chunks:
+            self.chunks.pop(chunk_loc, None)
+        return len(changes)
+
+    # remove a decoration placed with add_offgrid
+    def remove_offgrid(self, tile):
+        self.unshare()
+        index = self.offgrid_tiles.index(tile)
+        if self.journal:
+            self.journal.record_offgrid(index, tile, False)
+        del self.offgrid_tiles[index]
+        for chunk_loc in self.offgrid_tile_chunks(tile):
+            bucket = self.offgrid_chunks[chunk_loc]
+            bucket.remove(tile)
+            if not bucket:
+                del self.offgrid_chunks[chunk_loc]
+        self.version += 1
+        self.invalidate_tile(tile, ongrid=False)
+
+    # the pixel rect an offgrid tile covers, a single pixel for tiles without an image
+    def offgrid_rect(self, tile):
+        img = self.tile_image(tile)
+        size = img.get_size() if img else (1, 1)
+        return pygame.Rect(int(tile.pos[0]), int(tile.pos[1]), size[0], size[1])
+
+    # the chunks an offgrid tile is bucketed under
+    def offgrid_tile_chunks(self, tile):
+        tile_rect = self.offgrid_rect(tile)
+        chunk_px = CHUNK_SIZE * self.tile_size
+        return [(cx, cy) for cx in range(tile_rect.left // chunk_px, (tile_rect.right - 1) // chunk_px + 1) for cy in range(tile_rect.top // chunk_px, (tile_rect.bottom - 1) // chunk_px + 1)]
+
+    def index_offgrid(self, tile):
+        for chunk_loc in self.offgrid_tile_chunks(tile):
+            self.offgrid_chunks.setdefault(chunk_loc, []).append(tile)
+
+    def build_offgrid_index(self):
+        self.offgrid_chunks = {}
         for tile in self.offgrid_tiles:
-            variants = self.game.assets[tile['type']]
-            variant = tile.get('variant', 0)
-            if 0 <= variant < len(variants):
-                surf.blit(variants[variant], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ';' + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    variants = self.game.assets[tile['type']]
-                    variant = tile.get('variant', 0)
-                    if 0 <= variant < len(variants): 
-                        surf.blit(variants[variant], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+            self.index_offgrid(tile)
+
+    # offgrid tiles overlapping a pixel rect in draw order, found through the buckets of the chunks it touches
+    def offgrid_in_rect(self, rect):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        found = set()
+        for cx in range(rect.left // chunk_px, (rect.right - 1) // chunk_px + 1):
+            for cy in range(rect.top // chunk_px, (rect.bottom - 1) // chunk_px + 1):
+                for tile in self.offgrid_chunks.get((cx, cy), []):
+                    if id(tile) not in found and rect.colliderect(self.offgrid_rect(tile)):
+                        found.add(id(tile))
+        return [tile for tile in self.offgrid_tiles if id(tile) in found] if found else []
+
+    # offgrid tiles under a pixel position, only the bucket of the chunk it falls in is searched
+    def offgrid_at(self, pos):
+        # truncated the way pygame.Rect.collidepoint truncates it
+        pos = (int(pos[0]), int(pos[1]))
+        chunk_px = CHUNK_SIZE * self.tile_size
+        bucket = self.offgrid_chunks.get((pos[0] // chunk_px, pos[1] // chunk_px), [])
+        return [tile for tile in bucket if self.offgrid_rect(tile).collidepoint(pos)]
+
+    # returns the image of a tile in pixel space or None if the variant does not exist
+    # headless users such as the simulation have no tile images, for them there is nothing to draw
+    def tile_image(self, tile):
+        variants = self.game.assets.get(tile.type, []) if self.game else []
+        if 0 <= tile.variant < len(variants):
+            return variants[tile.variant]
+        return None
+
+    # tile images with the colorkey applied and premultiplied alpha, so stacking them in a chunk and blitting the chunk looks like blitting each tile directly
+    # the colours match, the alpha of half transparent edge pixels can come out one step off from rounding
+    def chunk_image(self, tile):
+        key = (tile.type, tile.variant)
+        if key not in self.chunk_images:
+            img = self.tile_image(tile)
+            if img:
+                # a plain blit onto a transparent surface drops the colorkeyed pixels and premultiplies the rest
+                baked = pygame.Surface(img.get_size(), pygame.SRCALPHA)
+                baked.blit(img, (0, 0))
+                img = baked
+            self.chunk_images[key] = img
+        return self.chunk_images[key]
+
+    # pixel position of the top left corner of a tile
+    def tile_pixel_pos(self, tile, ongrid=True):
+        if ongrid:
+            return (tile.pos[0] * self.tile_size, tile.pos[1] * self.tile_size)
+        return tile.pos
+
+    # drop every pre-rendered chunk that the image of the tile overlaps so they get rebuilt on the next render
+    def invalidate_tile(self, tile, ongrid=True):
+        for chunk_loc in self.tile_chunks(tile, ongrid):
+            self.chunks.pop(chunk_loc, None)
+
+    # the pre-rendered chunks the image of a tile overlaps
+    def tile_chunks(self, tile, ongrid=True):
+        img = self.tile_image(tile)
+        if not img:
+            return []
+        if not ongrid:
+            return self.offgrid_tile_chunks(tile)
+        x, y = self.tile_pixel_pos(tile, ongrid)
+        chunk_px = CHUNK_SIZE * self.tile_size
+        return [(cx, cy) for cx in range(int(x // chunk_px), int((x + img.get_width() - 1) // chunk_px) + 1) for cy in range(int(y // chunk_px), int((y + img.get_height() - 1) // chunk_px) + 1)]
+
+    # how many tiles an ongrid image reaches past its own cell
+    def image_spill(self, img):
+        if not img:
+            return 0
+        return max(0, math.ceil(max(img.get_width(), img.get_height()) / self.tile_size) - 1)
+
+    # the largest spill on the map, so chunks also pick up tiles reaching in from the left and top
+    def tile_spill(self):
+        if self.spill is None:
+            self.spill = max([self.image_spill(self.tile_image(tile)) for tile in self.tilemap.values()], default=0)
+        return self.spill
+
+    # draw all static geometry touching a chunk into a single surface
+    def build_chunk(self, chunk_loc):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        origin = (chunk_loc[0] * chunk_px, chunk_loc[1] * chunk_px)
+        surf = None
+
+        # offgrid tiles are drawn first so the grid sits on top of them like before
+        blits = []
+        for tile in self.offgrid_chunks.get(chunk_loc, []):
+            img = self.chunk_image(tile)
+            if img:
+                tile_rect = self.offgrid_rect(tile)
+                blits.append((img, (tile_rect.x - origin[0], tile_rect.y - origin[1])))
+
+        spill = self.tile_spill()
+        for x in range(chunk_loc[0] * CHUNK_SIZE - spill, (chunk_loc[0] + 1) * CHUNK_SIZE):
+            for y in range(chunk_loc[1] * CHUNK_SIZE - spill, (chunk_loc[1] + 1) * CHUNK_SIZE):
+                tile = self.tilemap.get((x, y))
+                if tile:
+                    img = self.chunk_image(tile)
+                    if img:
+                        blits.append((img, (x * self.tile_size - origin[0], y * self.tile_size - origin[1])))
+
+        if blits:
+            surf = pygame.Surface((chunk_px, chunk_px), pygame.SRCALPHA)
+            surf.blits([(img, pos, None, pygame.BLEND_PREMULTIPLIED) for img, pos in blits], doreturn=False)
+        return surf
+
+    # the whole map is always in memory here, StreamingTilemap loads chunks around the camera instead
+    def update_stream(self, scroll, view_size):
+        pass
+
+    # Render the offgrid and ongrid tiles one pre-rendered chunk at a time
+    def render(self, surf, offset=(0, 0)):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(offset[0] // chunk_px, (offset[0] + surf.get_width()) // chunk_px + 1):
+            for cy in range(offset[1] // chunk_px, (offset[1] + surf.get_height()) // chunk_px + 1):
+                chunk_loc = (cx, cy)
+                # taken out and put back so the chunks on screen are always the most recently seen
+                chunk = self.chunks.pop(chunk_loc) if chunk_loc in self.chunks else self.build_chunk(chunk_loc)
+                self.chunks[chunk_loc] = chunk
+                if chunk:
+                    surf.blit(chunk, (cx * chunk_px - offset[0], cy * chunk_px - offset[1]), special_flags=pygame.BLEND_PREMULTIPLIED)
+        self.evict_chunks(((offset[0] + surf.get_width()) // chunk_px - offset[0] // chunk_px + 1) * ((offset[1] + surf.get_height()) // chunk_px - offset[1] // chunk_px + 1))
+
+    # drop the least recently seen chunks past the budget, the same policy StreamingTilemap uses for resident chunks
+    # the chunks on screen are the newest and the budget never drops below them
+    def evict_chunks(self, on_screen):
+        excess = len(self.chunks) - max(self.max_chunk_surfaces, on_screen)
+        if excess > 0:
+            for chunk_loc in list(itertools.islice(self.chunks, excess)):
+                del self.chunks[chunk_loc]
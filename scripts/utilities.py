@@ -1,15 +1,129 @@
 # Utilities File
 
+import json
+import mmap
 import os
+import time
 import pygame
 
 BASE_IMG_PATH = 'data/images/'
 
+# decoded images are kept here between runs
+ASSET_CACHE_PATH = '.asset_cache/'
+
 # Allow only png files to be imported 
 valid_extensions = ['png', 'jpg']
 
+
+# Keeps the raw RGBA pixels of every decoded image in one file that is memory mapped on startup
+# entries are keyed by the source path and only used while the file's mtime and size still match
+# images.json names the pixel file it indexes, every save writes a new pixel file and then swaps the index in one replace
+class AssetCache:
+    def __init__(self, path=ASSET_CACHE_PATH):
+        self.path = path
+        self.index = None
+        self.data = None
+        self.data_name = None
+        self.pending = {}
+
+    def open(self):
+        self.close()
+        self.index = {}
+        self.data_name = None
+        try:
+            f = open(os.path.join(self.path, 'images.json'), 'r')
+            cache_index = json.load(f)
+            f.close()
+            # an index from before the pixel file was named in it is ignored and rewritten on the next save
+            if 'data' not in cache_index or 'images' not in cache_index:
+                return
+            f = open(os.path.join(self.path, cache_index['data']), 'rb')
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if cache_index['images'] else None
+            f.close()
+            self.index = cache_index['images']
+            self.data_name = cache_index['data']
+        except (OSError, ValueError):
+            self.index = {}
+            self.data = None
+
+    # unmap the pixel file, surfaces loaded from it have been converted to their own pixels by then
+    def close(self):
+        if self.data:
+            self.data.close()
+            self.data = None
+
+    # a surface with the pixels of the image file, from the cache when it is still fresh
+    def load(self, path):
+        if self.index is None:
+            self.open()
+
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        if self.data and entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            buffer = memoryview(self.data)[entry['offset']:entry['offset'] + entry['length']]
+            return pygame.image.frombuffer(buffer, (entry['width'], entry['height']), 'RGBA')
+
+        img = pygame.image.load(path)
+        self.pending[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'width': img.get_width(), 'height': img.get_height(), 'pixels': pygame.image.tobytes(img, 'RGBA')}
+        return img
+
+    # write newly decoded images to disk, entries for files that no longer exist are dropped
+    def save(self):
+        if not self.pending:
+            return
+
+        blobs = []
+        index = {}
+        offset = 0
+        for path, entry in self.index.items():
+            if path not in self.pending and os.path.exists(path):
+                blobs.append(self.data[entry['offset']:entry['offset'] + entry['length']])
+                index[path] = dict(entry, offset=offset)
+                offset += entry['length']
+        for path, entry in self.pending.items():
+            blobs.append(entry['pixels'])
+            index[path] = {'mtime_ns': entry['mtime_ns'], 'size': entry['size'], 'width': entry['width'], 'height': entry['height'], 'offset': offset, 'length': len(entry['pixels'])}
+            offset += len(entry['pixels'])
+
+        # the old pixels are copied out, so the mapping can go before any file is touched
+        self.close()
+
+        # a new pixel file under a name nobody else uses, then the index pointing at it swapped in with one replace
+        # whichever process replaces the index last wins, and an index always names a complete pixel file
+        os.makedirs(self.path, exist_ok=True)
+        token = str(os.getpid()) + '-' + str(time.time_ns())
+        data_name = 'images-' + token + '.bin'
+        f = open(os.path.join(self.path, data_name), 'wb')
+        f.write(b''.join(blobs))
+        f.close()
+        f = open(os.path.join(self.path, 'images.json.' + token), 'w')
+        json.dump({'data': data_name, 'images': index}, f)
+        f.close()
+        os.replace(os.path.join(self.path, 'images.json.' + token), os.path.join(self.path, 'images.json'))
+
+        self.pending = {}
+        self.open()
+        self.remove_stale_data()
+
+    # pixel files the index no longer names, one still mapped by another process is left for a later save
+    def remove_stale_data(self):
+        for name in os.listdir(self.path):
+            if name.startswith('images') and name.endswith('.bin') and name != self.data_name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+# set to None to always decode the image files
+asset_cache = AssetCache()
+
+
 def load_image(path):
-    img = pygame.image.load(BASE_IMG_PATH + path).convert_alpha()
+    if asset_cache:
+        img = asset_cache.load(BASE_IMG_PATH + path).convert_alpha()
+    else:
+        img = pygame.image.load(BASE_IMG_PATH + path).convert_alpha()
     img.set_colorkey((0, 0, 0))
     return img
 
@@ -21,18 +135,29 @@ def load_images(path):
     for img_name in sorted(os.listdir(base_path)):
         
         if not img_name.startswith('.') and img_name.split('.')[-1].lower() in valid_extensions:
-            print(f"Loading image: {base_path + '/' + img_name}")
             images.append(load_image(path + '/' + img_name))
-        else:
-            print(f"Ignoring file: {img_name}")
 
     return images
 
 
+# store any images decoded since startup so the next start can skip decoding them
+# the cache is only ever a speed up, a cache directory that cannot be written is no reason to stop the game
+def save_asset_cache():
+    if asset_cache:
+        try:
+            asset_cache.save()
+        except OSError:
+            pass
+
+
 # Create the player animation & update it in the main.py file
 class Animation:
-    def __init__(self, images, img_dur=5, loop=True):
+    def __init__(self, images, img_dur=5, loop=True, frames=None):
         self.images = images
+        # the upright and mirrored frames are made once here, exactly what rendering used to flip every frame
+        if frames is None:
+            frames = ([pygame.transform.flip(img, False, False) for img in images], [pygame.transform.flip(img, True, False) for img in images])
+        self.frames = frames
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
@@ -41,7 +166,7 @@ class Animation:
 
     # Copies the current animation regardless of the frame and returns the value for images, image_duration, and the current loop
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.frames)
 
 
     # Updates the current frame and animation
@@ -54,5 +179,68 @@ class Animation:
             else:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        return self.frames[flip][int(self.frame / self.img_duration)]
+
+
+# Packs every tile variant and animation frame into one surface and hands out subsurfaces of it
+class TextureAtlas:
+    def __init__(self, width=1024, padding=1):
+        self.width = width
+        self.padding = padding
+        self.surface = None
+        # (asset name, frame index, flipped) -> area of the atlas
+        self.regions = {}
+
+    # the frame of an asset as a subsurface of the atlas
+    def frame(self, name, index=0, flipped=False):
+        return self.surface.subsurface(self.regions[(name, index, flipped)])
+
+    # swap the images in an assets dict for atlas subsurfaces, single images like the screens are left alone
+    def pack(self, assets):
+        images = {}
+        for name, asset in assets.items():
+            if isinstance(asset, Animation):
+                for flipped in (False, True):
+                    for i, img in enumerate(asset.frames[flipped]):
+                        images[(name, i, flipped)] = img
+            elif isinstance(asset, list):
+                for i, img in enumerate(asset):
+                    images[(name, i, False)] = img
+
+        # shelf packing, tallest images first
+        x = y = shelf_height = 0
+        for key in sorted(images, key=lambda key: -images[key].get_height()):
+            img = images[key]
+            if x + img.get_width() > self.width:
+                x = 0
+                y += shelf_height + self.padding
+                shelf_height = 0
+            self.regions[key] = pygame.Rect(x, y, img.get_width(), img.get_height())
+            x += img.get_width() + self.padding
+            shelf_height = max(shelf_height, img.get_height())
+
+        self.surface = pygame.Surface((self.width, max(1, y + shelf_height)), pygame.SRCALPHA).convert_alpha()
+        frames = {}
+        for key, img in images.items():
+            # RGBA_MAX onto the empty atlas copies the pixels exactly, the colorkey is turned off so it cannot skip any
+            colorkey = img.get_colorkey()
+            # RLE keyed surfaces treat translucent black differently, so that is kept as well
+            colorkey_flags = pygame.RLEACCEL if img.get_flags() & pygame.RLEACCELOK else 0
+            img.set_colorkey(None)
+            self.surface.blit(img, self.regions[key], special_flags=pygame.BLEND_RGBA_MAX)
+            img.set_colorkey(colorkey, colorkey_flags)
+
+            frame = self.frame(*key)
+            if colorkey:
+                frame.set_colorkey(colorkey, colorkey_flags)
+            frames[key] = frame
+
+        for name, asset in assets.items():
+            if isinstance(asset, Animation):
+                for flipped in (False, True):
+                    asset.frames[flipped][:] = [frames[(name, i, flipped)] for i in range(len(asset.frames[flipped]))]
+                asset.images[:] = asset.frames[False]
+            elif isinstance(asset, list):
+                asset[:] = [frames[(name, i, False)] for i in range(len(asset))]
+        return assets
@@ -0,0 +1,30 @@
+# BatchPhysics has to step every entity exactly like the scalar Player does, bit for bit
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from bench_batch_physics import compare, scenario
+from scripts.simulation import HeadlessGame
+
+
+# the game loads its images relative to the repo root
+@pytest.fixture
+def game(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return HeadlessGame('map.json')
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_batch_matches_scalar(game, seed):
+    starts, inputs = scenario(100, 400, seed)
+    mismatch, batch, _, _ = compare(game, starts, inputs)
+    assert mismatch is None
+    # the runs should reach the lava and the trophy, not only walk around
+    assert batch.is_dead.any()